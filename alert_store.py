@@ -0,0 +1,174 @@
+import hashlib
+import json
+import os
+
+import requests
+
+from database import get_db_connection, alert_key
+from metrics import metrics, timed_get
+
+# Sources kept side by side in the alerts table
+GITHUB_SOURCE = 'github'
+FILE_SOURCE = 'file'
+
+# load_alerts() filter meaning "don't filter on this column"
+ANY = object()
+
+
+def blob_sha(body):
+    # Git's blob id for `body`, the same SHA GitHub reports for the file
+    return hashlib.sha1(b"blob %d\0" % len(body) + body).hexdigest()
+
+def alert_movie(alert):
+    name = alert.get('name')
+    return name.strip().lower() if name else None
+
+def source_state(conn, source):
+    return conn.execute('SELECT * FROM alert_sources WHERE source = ?', (source,)).fetchone()
+
+def save_state(conn, source, etag=None, sha=None, mtime=None, size=None):
+    conn.execute('''
+        INSERT INTO alert_sources (source, etag, blob_sha, mtime, size, synced_at)
+        VALUES (?, ?, ?, ?, ?, datetime('now'))
+        ON CONFLICT(source) DO UPDATE SET
+            etag = excluded.etag,
+            blob_sha = excluded.blob_sha,
+            mtime = excluded.mtime,
+            size = excluded.size,
+            synced_at = excluded.synced_at
+    ''', (source, etag, sha, mtime, size))
+
+def materialize(conn, source, alerts):
+    # Replaces the active alerts of `source` with `alerts`. Rows are keyed
+    # by alert_key, so an alert that survives an edit of the file keeps its
+    # row; alerts no longer in the file are deactivated, not deleted.
+    rows = {}
+    for position, alert in enumerate(alerts):
+        key = alert_key(alert)
+        rows.setdefault(key, (
+            source, key, position, alert.get('city'), alert_movie(alert),
+            alert.get('url') or None, json.dumps(alert)
+        ))
+
+    conn.execute('UPDATE alerts SET is_active = 0 WHERE source = ? AND is_active = 1', (source,))
+    conn.executemany('''
+        INSERT INTO alerts (source, alert_key, position, city, movie, url, payload, is_active)
+        VALUES (?, ?, ?, ?, ?, ?, ?, 1)
+        ON CONFLICT(source, alert_key) DO UPDATE SET
+            position = excluded.position,
+            is_active = 1
+    ''', list(rows.values()))
+    metrics.record_rows('alerts', len(rows))
+    return len(rows)
+
+def sync_from_url(url, source=GITHUB_SOURCE):
+    # Conditional GET against the stored ETag: an unchanged alerts.json is
+    # a single 304. A 200 whose blob SHA matches the stored one only
+    # refreshes the ETag. On errors the last synced alerts stay in place.
+    conn = get_db_connection()
+    try:
+        state = source_state(conn, source)
+        headers = {'If-None-Match': state['etag']} if state and state['etag'] else {}
+        try:
+            response = timed_get(requests.get, url, headers=headers)
+        except Exception as e:
+            print(f"Error fetching alerts: {e}")
+            metrics.inc('alert_syncs_total', source=source, result='error')
+            return False
+
+        if response.status_code == 304:
+            metrics.inc('alert_syncs_total', source=source, result='not_modified')
+            return False
+        if response.status_code != 200:
+            print(f"Failed to fetch alerts.json: {response.status_code}")
+            metrics.inc('alert_syncs_total', source=source, result='error')
+            return False
+
+        sha = blob_sha(response.content)
+        etag = response.headers.get('ETag')
+        changed = not state or state['blob_sha'] != sha
+        if changed:
+            try:
+                alerts = response.json()
+            except ValueError as e:
+                print(f"Error parsing alerts.json: {e}")
+                metrics.inc('alert_syncs_total', source=source, result='error')
+                return False
+            count = materialize(conn, source, alerts)
+            print(f"Synced {count} alerts from {url}")
+        save_state(conn, source, etag=etag, sha=sha)
+        conn.commit()
+        metrics.inc('alert_syncs_total', source=source, result='changed' if changed else 'unchanged')
+        return changed
+    finally:
+        conn.close()
+
+def sync_from_file(path, source=FILE_SOURCE):
+    # Same for a local file: an unchanged mtime and size skip reading it,
+    # an unchanged blob SHA skips parsing it
+    conn = get_db_connection()
+    try:
+        try:
+            stat = os.stat(path)
+        except OSError as e:
+            print(f"Error reading {path}: {e}")
+            metrics.inc('alert_syncs_total', source=source, result='error')
+            return False
+
+        state = source_state(conn, source)
+        if state and state['mtime'] == stat.st_mtime and state['size'] == stat.st_size:
+            metrics.inc('alert_syncs_total', source=source, result='not_modified')
+            return False
+
+        with open(path, 'rb') as f:
+            body = f.read()
+        sha = blob_sha(body)
+        changed = not state or state['blob_sha'] != sha
+        if changed:
+            try:
+                alerts = json.loads(body)
+            except ValueError as e:
+                print(f"Error reading {path}: {e}")
+                metrics.inc('alert_syncs_total', source=source, result='error')
+                return False
+            count = materialize(conn, source, alerts)
+            print(f"Synced {count} alerts from {path}")
+        save_state(conn, source, sha=sha, mtime=stat.st_mtime, size=stat.st_size)
+        conn.commit()
+        metrics.inc('alert_syncs_total', source=source, result='changed' if changed else 'unchanged')
+        return changed
+    finally:
+        conn.close()
+
+def alert_cities(source):
+    # Cities with active alerts of `source`, in the order they first appear
+    # in the file (None for alerts without a city)
+    conn = get_db_connection()
+    try:
+        rows = conn.execute('''
+            SELECT city FROM alerts WHERE source = ? AND is_active = 1
+            GROUP BY city ORDER BY MIN(position)
+        ''', (source,)).fetchall()
+    finally:
+        conn.close()
+    return [row['city'] for row in rows]
+
+def load_alerts(source, city=ANY, with_url=False):
+    # Active alerts of `source` in file order, optionally only one city
+    # (None = alerts without a city) or those with a URL
+    clauses = ['source = ?', 'is_active = 1']
+    params = [source]
+    if city is not ANY:
+        clauses.append('city IS ?')
+        params.append(city)
+    if with_url:
+        clauses.append('url IS NOT NULL')
+
+    conn = get_db_connection()
+    try:
+        rows = conn.execute(
+            f"SELECT payload FROM alerts WHERE {' AND '.join(clauses)} ORDER BY position", params
+        ).fetchall()
+    finally:
+        conn.close()
+    return [json.loads(row['payload']) for row in rows]
@@ -1,11 +1,234 @@
 from flask import Flask, request
 from twilio.twiml.messaging_response import MessagingResponse
-from github import Github
+from github import Github, GithubException
+import atexit
 import os
 import json
+import queue
+import threading
+import time
+from concurrent.futures import Future
 
 app = Flask(__name__)
 
+CONFIG_FILE = "config.json"
+
+# Seconds a fetched config.json is served without asking GitHub again
+CACHE_TTL = float(os.environ.get("WEBHOOK_CACHE_TTL", 30))
+# On Vercel an instance is frozen as soon as the response is returned and
+# may be killed without running atexit, so every command is committed
+# before replying there
+SYNC_WRITES = bool(os.environ.get("VERCEL"))
+# Seconds the writer waits for more commands before committing them together
+BATCH_WINDOW = float(os.environ.get("WEBHOOK_BATCH_WINDOW", 0 if SYNC_WRITES else 2))
+# Attempts per batch when someone else committed config.json in between
+MAX_COMMIT_ATTEMPTS = 3
+
+HELP_TEXT = "🤖 I didn't understand that.\n\nCommands:\n- 'Track [URL]': Change movie\n- 'Status': Check current movie"
+
+# ===== GitHub access, shared by every request this instance serves =====
+
+_repo = None
+_repo_lock = threading.Lock()
+
+def get_repo():
+    # One authenticated client per warm instance instead of one per message
+    global _repo
+    with _repo_lock:
+        if _repo is None:
+            _repo = Github(os.environ["GITHUB_TOKEN"]).get_repo(os.environ["GITHUB_REPO"])
+        return _repo
+
+
+class ContentCache:
+    # config.json as last read from GitHub. Entries live CACHE_TTL
+    # seconds; parsed contents are kept per blob SHA, so a refresh that
+    # finds the same blob doesn't decode it again.
+
+    def __init__(self, repo_factory=get_repo, ttl=CACHE_TTL):
+        self.repo_factory = repo_factory
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        # Held while fetching, so a burst of misses costs one GitHub read
+        self.fetch_lock = threading.Lock()
+        self.entries = {}   # path -> (sha, fetched_at)
+        self.parsed = {}    # sha -> parsed JSON
+        self.hits = 0
+        self.misses = 0
+
+    def cached(self, path, since=None):
+        # Entry still within the TTL (or fetched after `since`), else None
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is None:
+                return None
+            if since is not None and entry[1] <= since:
+                return None
+            if since is None and time.monotonic() - entry[1] >= self.ttl:
+                return None
+            self.hits += 1
+            return entry[0], self.parsed[entry[0]]
+
+    def get(self, path, fresh=False):
+        # (sha, parsed JSON); fresh=True skips the TTL (before a commit)
+        requested = time.monotonic()
+        found = None if fresh else self.cached(path)
+        if found:
+            return found
+
+        with self.fetch_lock:
+            # Someone else may have fetched it while we waited
+            found = self.cached(path, since=requested if fresh else None)
+            if found:
+                return found
+            with self.lock:
+                self.misses += 1
+            contents = self.repo_factory().get_contents(path)
+            with self.lock:
+                if contents.sha not in self.parsed:
+                    self.parsed[contents.sha] = json.loads(contents.decoded_content.decode())
+                self.entries[path] = (contents.sha, time.monotonic())
+                return contents.sha, self.parsed[contents.sha]
+
+    def put(self, path, sha, data):
+        # What we just committed, so the next read needn't fetch it back
+        with self.lock:
+            self.parsed[sha] = data
+            self.entries[path] = (sha, time.monotonic())
+
+    def summary(self):
+        return f"Config cache: {self.hits} hits, {self.misses} fetches"
+
+
+class WriteBehind:
+    # Config changes queued by the webhook and committed from a background
+    # thread. Commands arriving within BATCH_WINDOW of each other go out as
+    # one commit; until then pending() answers reads, so "Status" right
+    # after "Track" already sees the new URL. Failed commands are kept for
+    # take_failures(), unless the caller waited for the commit itself.
+
+    def __init__(self, cache, repo_factory=get_repo, path=CONFIG_FILE, window=BATCH_WINDOW):
+        self.cache = cache
+        self.repo_factory = repo_factory
+        self.path = path
+        self.window = window
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.overrides = {}     # key -> value still waiting to be committed
+        self.failures = []      # notes of commands whose commit failed
+        self.commits = 0
+        self.commands = 0
+        self.failed = 0
+        self.worker = threading.Thread(target=self._work, name="config-writer", daemon=True)
+        self.worker.start()
+
+    def submit(self, key, value, note, wait=False):
+        # wait=True blocks until the command's batch is committed and
+        # returns whether that worked
+        done = Future()
+        with self.lock:
+            self.overrides[key] = value
+        self.queue.put((key, value, note, done, wait))
+        return done.result() if wait else done
+
+    def pending(self):
+        with self.lock:
+            return dict(self.overrides)
+
+    def take_failures(self):
+        # Failed commands not reported yet, oldest first
+        with self.lock:
+            failures, self.failures = self.failures, []
+            return failures
+
+    def _work(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.window
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    self.queue.put(None)
+                    break
+                batch.append(item)
+            self._commit(batch)
+
+    def _commit(self, batch):
+        notes = [note for _, _, note, _, _ in batch]
+        message = notes[0] if len(notes) == 1 else f"Apply {len(notes)} WhatsApp commands\n\n" + "\n".join(notes)
+
+        for attempt in range(MAX_COMMIT_ATTEMPTS):
+            try:
+                sha, config = self.cache.get(self.path, fresh=True)
+                config = dict(config)
+                for key, value, _, _, _ in batch:
+                    config[key] = value
+                result = self.repo_factory().update_file(
+                    path=self.path,
+                    message=message,
+                    content=json.dumps(config, indent=2),
+                    sha=sha
+                )
+            except GithubException as e:
+                # 409: config.json moved on since we read it, re-read and retry
+                if e.status == 409 and attempt + 1 < MAX_COMMIT_ATTEMPTS:
+                    continue
+                print(f"Failed to commit {len(batch)} config changes: {e}")
+                break
+            except Exception as e:
+                print(f"Failed to commit {len(batch)} config changes: {e}")
+                break
+
+            self.cache.put(self.path, result["content"].sha, config)
+            with self.lock:
+                self.commits += 1
+                self.commands += len(batch)
+                # Keep overrides a newer, still queued command has replaced
+                for key, value, _, _, _ in batch:
+                    if self.overrides.get(key) == value:
+                        del self.overrides[key]
+            for _, _, _, done, _ in batch:
+                done.set_result(True)
+            return
+
+        with self.lock:
+            self.failed += len(batch)
+            self.failures.extend(note for _, _, note, _, waited in batch if not waited)
+            for key, value, _, _, _ in batch:
+                if self.overrides.get(key) == value:
+                    del self.overrides[key]
+        for _, _, _, done, _ in batch:
+            done.set_result(False)
+
+    def close(self):
+        # Commits whatever is still queued, then stops the worker. Only runs
+        # on a normal interpreter exit, never on a killed serverless instance
+        self.queue.put(None)
+        self.worker.join()
+
+    def summary(self):
+        return f"Config writer: {self.commands} commands in {self.commits} commits, {self.failed} failed"
+
+
+cache = ContentCache()
+writer = WriteBehind(cache)
+atexit.register(writer.close)
+
+def current_config():
+    _, config = cache.get(CONFIG_FILE)
+    return dict(config, **writer.pending())
+
+# ===== Webhook =====
+
 @app.route('/api/webhook', methods=['POST'])
 def bot():
     # 1. Get the message from Twilio
@@ -13,47 +236,35 @@ def bot():
     resp = MessagingResponse()
     msg = resp.message()
 
-    # 2. Authenticate with GitHub
-    github_token = os.environ.get("GITHUB_TOKEN")
-    repo_name = os.environ.get("GITHUB_REPO") # e.g., "username/repo"
-    
-    if not github_token or not repo_name:
+    # 2. Check the GitHub settings (the client itself is created once)
+    if not os.environ.get("GITHUB_TOKEN") or not os.environ.get("GITHUB_REPO"):
         msg.body("⚠️ Error: Server misconfiguration (Missing GitHub secrets).")
         return str(resp)
 
     try:
-        g = Github(github_token)
-        repo = g.get_repo(repo_name)
-        file_path = "config.json"
-        
         # 3. Handle Commands
         if incoming_msg.lower().startswith("track "):
             # Extract URL
             new_url = incoming_msg[6:].strip()
-            
-            # Update config.json in GitHub
-            contents = repo.get_contents(file_path)
-            current_config = json.loads(contents.decoded_content.decode())
-            current_config["url"] = new_url
-            
-            # Commit changes
-            repo.update_file(
-                path=file_path,
-                message=f"Update movie URL via WhatsApp: {new_url}",
-                content=json.dumps(current_config, indent=2),
-                sha=contents.sha
-            )
-            
-            msg.body(f"✅ Roger that! Now tracking: {new_url}")
-            
+
+            # Reply now, the commit happens in the background (unless the
+            # instance may be frozen right after replying)
+            saved = writer.submit("url", new_url, f"Update movie URL via WhatsApp: {new_url}", wait=SYNC_WRITES)
+            if saved is False:
+                msg.body(f"⚠️ Couldn't save {new_url}, please send the Track command again.")
+            else:
+                msg.body(f"✅ Roger that! Now tracking: {new_url}")
+
         elif incoming_msg.lower() == "status":
-            contents = repo.get_contents(file_path)
-            current_config = json.loads(contents.decoded_content.decode())
-            current_url = current_config.get("url", "Unknown")
-            msg.body(f"🕵️ Currently tracking: {current_url}")
-            
+            current_url = current_config().get("url", "Unknown")
+            reply = f"🕵️ Currently tracking: {current_url}"
+            failures = writer.take_failures()
+            if failures:
+                reply += "\n\n⚠️ These changes could not be saved, please send them again:\n" + "\n".join(f"- {note}" for note in failures)
+            msg.body(reply)
+
         else:
-            msg.body("🤖 I didn't understand that.\n\nCommands:\n- 'Track [URL]': Change movie\n- 'Status': Check current movie")
+            msg.body(HELP_TEXT)
 
     except Exception as e:
         msg.body(f"⚠️ Error processing request: {str(e)}")
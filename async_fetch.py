@@ -0,0 +1,112 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import metrics, timed_get
+from profiling import working_on
+
+# Max in-flight requests per host. BMS copes with more parallel
+# requests than District, anything else gets the default.
+HOST_LIMITS = {
+    "in.bookmyshow.com": 8,
+    "www.district.in": 4,
+}
+DEFAULT_HOST_LIMIT = 4
+
+# (connect, read) timeout in seconds, applied to every request
+REQUEST_TIMEOUT = (5, 20)
+
+
+class AsyncFetcher:
+    # Runs blocking requests calls on a thread pool so many pages can be
+    # in flight at once. Every host gets its own keep-alive session and a
+    # semaphore capping how many requests hit it concurrently.
+
+    def __init__(self, headers=None, host_limits=None, default_limit=DEFAULT_HOST_LIMIT, timeout=REQUEST_TIMEOUT, budget=None):
+        self.headers = headers or {}
+        # Optional ratelimit.TokenBucket shared by every request, across hosts
+        self.budget = budget
+        self.host_limits = dict(HOST_LIMITS)
+        if host_limits:
+            self.host_limits.update(host_limits)
+        self.default_limit = default_limit
+        self.timeout = timeout
+
+        self.sessions = {}
+        self.semaphores = {}
+        max_workers = sum(self.host_limits.values()) + default_limit
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="fetch")
+
+    def host_limit(self, host):
+        return self.host_limits.get(host, self.default_limit)
+
+    def _session(self, host):
+        session = self.sessions.get(host)
+        if session is None:
+            limit = self.host_limit(host)
+            session = requests.Session()
+            session.headers.update(self.headers)
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=limit)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            self.sessions[host] = session
+        return session
+
+    def _semaphore(self, host):
+        # Created lazily so it binds to the loop that is actually running
+        semaphore = self.semaphores.get(host)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.host_limit(host))
+            self.semaphores[host] = semaphore
+        return semaphore
+
+    async def _spend_budget(self):
+        if self.budget is not None:
+            delay = self.budget.reserve()
+            if delay:
+                await asyncio.sleep(delay)
+
+    async def get(self, url, **kwargs):
+        host = urlparse(url).netloc.lower()
+        kwargs.setdefault("timeout", self.timeout)
+        call = functools.partial(timed_get, self._session(host).get, url, **kwargs)
+
+        await self._spend_budget()
+        async with self._semaphore(host):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, call)
+
+    async def stream(self, url, consume, **kwargs):
+        # Like get(), but hands the streaming response to consume() on the
+        # worker thread and closes the connection as soon as it returns,
+        # whether or not the body was read to the end.
+        host = urlparse(url).netloc.lower()
+        kwargs.setdefault("timeout", self.timeout)
+        session = self._session(host)
+
+        def run():
+            with timed_get(session.get, url, stream=True, **kwargs) as response:
+                with metrics.timer('parse_seconds', stage='probe'), working_on(url):
+                    return response, consume(response)
+
+        await self._spend_budget()
+        async with self._semaphore(host):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, run)
+
+    def close(self):
+        for session in self.sessions.values():
+            session.close()
+        self.sessions.clear()
+        self.semaphores.clear()
+        self.executor.shutdown(wait=False)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,100 @@
+import argparse
+import os
+import re
+import sys
+import tempfile
+import time
+
+# Run from anywhere: python benchmarks/bench_save_to_db.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+import fetch_district
+
+
+def synthetic_city(movies, theatres, dates, times):
+    # movies x theatres x dates x times showtimes, defaults give 100k
+    movies_data = []
+    for m in range(movies):
+        showtimes = []
+        for t in range(theatres):
+            for d in range(dates):
+                for h in range(times):
+                    showtimes.append({
+                        "theatre": f"Synthetic Cinemas Screen {t}",
+                        "date": f"2025-01-{d + 1:02d}",
+                        "time": f"{(9 + h * 3) % 12 or 12:02d}:00 {'AM' if 9 + h * 3 < 12 else 'PM'}",
+                        "link": f"https://www.district.in/movies/movie-{m}/{t}"
+                    })
+        movies_data.append({
+            "title": f"Synthetic Movie {m}",
+            "slug": f"synthetic-movie-{m}-movie-tickets-in-benchcity-MV{m:06d}",
+            "showtimes": showtimes,
+            "language": "English",
+            "format": "2D"
+        })
+    return movies_data
+
+
+def legacy_save_to_db(city_name, movies_data):
+    # Row-at-a-time version save_to_db replaced, kept for comparison
+    conn = database.get_db_connection()
+    cursor = conn.cursor()
+    for movie in movies_data:
+        cursor.execute('''
+            INSERT OR IGNORE INTO movies (title, slug, city, language, format)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (movie['title'], movie['slug'], city_name, movie.get('language'), movie.get('format')))
+        cursor.execute('SELECT id FROM movies WHERE slug = ? AND city = ?', (movie['slug'], city_name))
+        movie_id = cursor.fetchone()[0]
+        for show in movie.get('showtimes', []):
+            theatre_name = show['theatre']
+            theatre_slug = re.sub(r'[^a-zA-Z0-9]', '', theatre_name.lower())
+            cursor.execute('''
+                INSERT OR IGNORE INTO theatres (name, city, slug)
+                VALUES (?, ?, ?)
+            ''', (theatre_name, city_name, theatre_slug))
+            cursor.execute('SELECT id FROM theatres WHERE name = ? AND city = ?', (theatre_name, city_name))
+            theatre_id = cursor.fetchone()[0]
+            cursor.execute('''
+                INSERT OR IGNORE INTO showtimes (movie_id, theatre_id, show_date, show_time, link)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (movie_id, theatre_id, show['date'], show['time'], show.get('link')))
+    conn.commit()
+    conn.close()
+
+
+def run(name, save, movies_data, rows):
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DB_FILE = os.path.join(tmp, 'bench.db')
+        database.init_db()
+
+        started = time.perf_counter()
+        save("BenchCity", movies_data)
+        elapsed = time.perf_counter() - started
+
+        conn = database.get_db_connection()
+        stored = conn.execute('SELECT COUNT(*) FROM showtimes').fetchone()[0]
+        conn.close()
+        database.close_all_connections()
+
+    print(f"{name:>8}: {rows} showtimes in {elapsed:.2f}s ({rows / elapsed:,.0f} rows/sec, {stored} stored)")
+    return elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark fetch_district.save_to_db on a synthetic city.")
+    parser.add_argument("--movies", type=int, default=100)
+    parser.add_argument("--theatres", type=int, default=50)
+    parser.add_argument("--dates", type=int, default=4)
+    parser.add_argument("--times", type=int, default=5)
+    parser.add_argument("--skip-legacy", action="store_true", help="only time the bulk path")
+    args = parser.parse_args()
+
+    movies_data = synthetic_city(args.movies, args.theatres, args.dates, args.times)
+    rows = sum(len(m['showtimes']) for m in movies_data)
+
+    bulk = run("bulk", fetch_district.save_to_db, movies_data, rows)
+    if not args.skip_legacy:
+        legacy = run("legacy", legacy_save_to_db, movies_data, rows)
+        print(f"Speedup: {legacy / bulk:.1f}x")
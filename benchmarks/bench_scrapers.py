@@ -0,0 +1,350 @@
+import argparse
+import contextlib
+import datetime
+import functools
+import io
+import json
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+# Run from anywhere: python benchmarks/bench_scrapers.py
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+# Offline notifications, fast enough not to dominate check_tickets
+os.environ.setdefault('NOTIFY_TRANSPORT', 'stub')
+os.environ.setdefault('NOTIFY_STUB_LATENCY', '0')
+os.environ.setdefault('TWILIO_MESSAGES_PER_SECOND', '1000')
+
+import fixtures
+from reporting import load_baseline, report, save_results
+from theatre_crawler import CRAWL_DAYS, booking_url
+
+TARGETS = ["unified", "district", "monitor"]
+COUNTED_TABLES = ["movies", "theatres", "showtimes", "notification_state"]
+
+
+# ===== Synthetic fixtures =====
+#
+# Used when no recorded store is given: pages shaped like the ones each
+# scraper parses, so the suite runs anywhere without network access.
+
+def filler(rng, size):
+    return "".join(f"<div class='c{rng.randint(0, 99)}'><span>lorem ipsum {i}</span></div>" for i in range(size))
+
+def bms_city_pages(rng, city, movies, theatres):
+    pages = {}
+    name, code, slug = city['name'], city['code'], city['slug']
+    entries = [(f"synthetic-movie-{i}", f"ET9{i:07d}") for i in range(movies)]
+
+    cards = "".join(
+        f'<a href="/movies/{slug}/{movie_slug}/{event}"><img alt="Synthetic Movie {i}"></a>'
+        for i, (movie_slug, event) in enumerate(entries)
+    )
+    pages[f"https://in.bookmyshow.com/explore/movies-{name.lower()}"] = (
+        f"<html><body>{filler(rng, 400)}{cards}<p>IMAX 4DX 2D 3D</p></body></html>"
+    )
+    pages[f"https://in.bookmyshow.com/explore/upcoming-movies-{name.lower()}"] = (
+        f"<html><body>{filler(rng, 200)}"
+        '<a href="/movies/{0}/coming-soon/ET80000001"><img alt="Coming Soon"></a></body></html>'.format(slug)
+    )
+
+    today = datetime.date.today()
+    for movie_slug, event in entries:
+        movie_url = f"https://in.bookmyshow.com/movies/{slug}/{movie_slug}/{event}"
+        for offset in range(CRAWL_DAYS):
+            date = today + datetime.timedelta(days=offset)
+            venues = rng.sample(range(theatres), min(theatres, 8))
+            rows = "".join(
+                f'<li><a href="/cinemas/{slug}/screen-{t}/{code}{t}">Synthetic Screen {t}: {name}</a>'
+                f'<a>10:00 AM</a><a>01:30 PM</a><a>07:30 PM</a><span>IMAX</span></li>'
+                for t in venues
+            )
+            pages[booking_url(movie_url, code, slug, date)] = f"<html><body>{filler(rng, 300)}<ul>{rows}</ul></body></html>"
+
+        # What movie_monitor sees: the movie page links to today's booking page
+        pages[movie_url] = (
+            f"<html><body>{filler(rng, 600)}"
+            f"<a href='{booking_url(movie_url, code, slug, today)}'>Book tickets</a>"
+            f"{filler(rng, 600)}</body></html>"
+        )
+    return pages
+
+def district_city_pages(rng, city, movies, theatres):
+    pages = {}
+    name = city['name']
+    today = datetime.date.today()
+    for i in range(movies):
+        url = f"https://www.district.in/movies/synthetic-movie-{i}-movie-tickets-in-{name.lower()}-MV{i:06d}"
+        cinemas = [
+            {
+                "cinemaName": f"District Screen {t} {name}",
+                "sessions": [
+                    {"showTime": f"{today + datetime.timedelta(days=d)}T{h:02d}:30:00+05:30", "format": "2D", "language": "Hindi"}
+                    for d in range(CRAWL_DAYS) for h in (10, 14, 19, 22)
+                ]
+            }
+            for t in rng.sample(range(theatres), min(theatres, 8))
+        ]
+        data = {"props": {"pageProps": {"initialState": {"cinemas": cinemas}}}}
+        pages[url] = (
+            f"<html><head><title>Synthetic Movie {i} Movie Tickets | District</title></head>"
+            f"<body>{filler(rng, 800)}"
+            f'<script id="__NEXT_DATA__" type="application/json">{json.dumps(data)}</script></body></html>'
+        )
+    return pages
+
+def synthesize(path, cities, movies, theatres, seed=1):
+    rng = random.Random(seed)
+    store = fixtures.FixtureStore(path)
+    for city in cities:
+        pages = bms_city_pages(rng, city, movies, theatres)
+        pages.update(district_city_pages(rng, city, movies, theatres))
+        for url, html in pages.items():
+            store.record('GET', url, 200, {'Content-Type': 'text/html; charset=utf-8'}, html.encode(), save=False)
+    store.save()
+    return store
+
+
+# ===== Measurement =====
+
+class StageTimer:
+    # Wraps functions to add up the wall time spent inside them. Nested
+    # timed calls on the same thread count once (the outermost).
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.calls = 0
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def wrap(self, func):
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            if getattr(self.local, 'depth', 0):
+                return func(*args, **kwargs)
+            self.local.depth = 1
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - started
+                self.local.depth = 0
+                with self.lock:
+                    self.seconds += elapsed
+                    self.calls += 1
+        return timed
+
+@contextmanager
+def patched(hooks, timer):
+    # hooks: [(module, attribute)], each replaced by a timed wrapper
+    originals = [(module, name, getattr(module, name)) for module, name in hooks]
+    for module, name, func in originals:
+        setattr(module, name, timer.wrap(func))
+    try:
+        yield
+    finally:
+        for module, name, func in originals:
+            setattr(module, name, func)
+
+def count_rows(db_file):
+    if not os.path.exists(db_file):
+        return 0
+    conn = sqlite3.connect(db_file)
+    total = 0
+    for table in COUNTED_TABLES:
+        try:
+            total += conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+        except sqlite3.OperationalError:
+            pass
+    conn.close()
+    return total
+
+@contextmanager
+def workspace(cities):
+    # Fresh cwd per target: every relative data/ path lands in a temp dir
+    previous = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.makedirs(os.path.join(tmp, 'data'))
+        with open(os.path.join(tmp, 'data', 'cities.json'), 'w') as f:
+            json.dump(cities, f)
+        os.chdir(tmp)
+        import database
+        with contextlib.redirect_stdout(io.StringIO()):
+            database.init_db()
+        try:
+            yield tmp
+        finally:
+            database.close_all_connections()
+            os.chdir(previous)
+
+
+# ===== Targets =====
+
+class NoBrowserPool:
+    # fetch_district discovers movie URLs with Chrome; the benchmark takes
+    # them from the fixture store instead and times everything after that
+    def __init__(self, size=1):
+        pass
+
+    @contextmanager
+    def session(self):
+        yield None
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def summary(self):
+        return "Browser pool: skipped (benchmark)"
+
+def run_unified(store, args):
+    import fetch_unified
+    import scraping
+    import theatre_crawler
+    scraping.memo.clear()
+    parse = [(scraping, 'BeautifulSoup'), (theatre_crawler, 'parse_booking_page')]
+    db = [(fetch_unified, 'save_movies_to_db'), (fetch_unified, 'save_crawl'), (fetch_unified, 'export_metadata')]
+    return parse, db, lambda: fetch_unified.main(args.workers)
+
+def run_district(store, args):
+    import fetch_district
+    import scraping
+    scraping.memo.clear()
+
+    def discover(city_name, driver):
+        marker = f"-movie-tickets-in-{city_name.lower()}-"
+        return [url for url in store.urls() if 'district.in/movies/' in url and marker in url]
+
+    fetch_district.BrowserPool = NoBrowserPool
+    fetch_district.get_movie_urls_selenium = discover
+    parse = [(fetch_district, 'slice_next_data'), (fetch_district, 'loads'),
+             (fetch_district, 'extract_showtimes'), (fetch_district, 'page_title')]
+    db = [(fetch_district, 'save_to_db'), (fetch_district, 'export_metadata')]
+    return parse, db, fetch_district.main
+
+def run_monitor(store, args):
+    import movie_monitor
+    urls = [url for url in store.urls() if '/movies/' in url and 'bookmyshow.com' in url]
+    alerts = []
+    for i, url in enumerate(sorted(urls)):
+        filters = [] if i % 2 else ["IMAX", "TIME:EVENING"]
+        alerts.append({"name": f"Alert {i}", "url": url, "phone": f"whatsapp:+9100000{i:05d}", "filters": filters})
+    with open('alerts.json', 'w') as f:
+        json.dump(alerts, f)
+
+    parse = [(movie_monitor.BookingProbe, 'feed'), (movie_monitor, 'BeautifulSoup')]
+    db = [(movie_monitor, 'record_notification')]
+    return parse, db, movie_monitor.check_tickets
+
+RUNNERS = {"unified": run_unified, "district": run_district, "monitor": run_monitor}
+
+def measure(target, store, server, cities, args):
+    with workspace(cities):
+        try:
+            parse_hooks, db_hooks, job = RUNNERS[target](store, args)
+        except ImportError as e:
+            print(f"  {target}: skipped ({e})")
+            return None
+
+        parse_timer, db_timer = StageTimer(), StageTimer()
+        db_file = os.path.join('data', 'movies.db')
+        rows_before = count_rows(db_file)
+        requests_before, bytes_before = server.requests, server.bytes_sent
+
+        output = io.StringIO()
+        started = time.perf_counter()
+        with patched(parse_hooks, parse_timer), patched(db_hooks, db_timer):
+            with contextlib.redirect_stdout(output if not args.verbose else sys.stdout):
+                job()
+        wall = time.perf_counter() - started
+
+        import database
+        database.close_all_connections()
+        rows = count_rows(db_file) - rows_before
+        pages = server.requests - requests_before
+
+    return {
+        "wall_s": round(wall, 3),
+        "pages": pages,
+        "pages_per_s": round(pages / wall, 2) if wall else 0,
+        "kb": round((server.bytes_sent - bytes_before) / 1024, 1),
+        # Summed over threads, so it can exceed wall_s for concurrent jobs
+        "parse_s": round(parse_timer.seconds, 3),
+        "parse_ms_per_page": round(1000 * parse_timer.seconds / pages, 2) if pages else 0,
+        "db_s": round(db_timer.seconds, 3),
+        "rows": rows,
+        "rows_per_s": round(rows / db_timer.seconds) if db_timer.seconds else 0,
+    }
+
+
+# ===== Reporting =====
+
+COLUMNS = ["wall_s", "pages", "pages_per_s", "kb", "parse_s", "parse_ms_per_page", "db_s", "rows", "rows_per_s"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the scrapers and the ticket checker against a local stand-in server.")
+    parser.add_argument("--fixtures", help="recorded fixture store (default: synthetic pages)")
+    parser.add_argument("--targets", default=",".join(TARGETS), help="comma separated: " + ", ".join(TARGETS))
+    parser.add_argument("--cities", type=int, default=3, help="cities from data/cities.json to run")
+    parser.add_argument("--movies", type=int, default=12, help="synthetic movies per city")
+    parser.add_argument("--theatres", type=int, default=20, help="synthetic theatres per city")
+    parser.add_argument("--workers", type=int, default=4, help="fetch_unified city workers")
+    parser.add_argument("--latency", type=float, default=0.05, help="stand-in server latency per request")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate", type=float, default=50.0, help="per-host requests/sec allowed by the scrapers")
+    parser.add_argument("--output", help="write results as JSON here")
+    parser.add_argument("--compare", help="previous --output file to diff against")
+    parser.add_argument("--verbose", action="store_true", help="show the jobs' own output")
+    args = parser.parse_args()
+
+    with open(os.path.join(REPO_DIR, 'data', 'cities.json'), 'r') as f:
+        cities = json.load(f)[:args.cities]
+
+    import scraping
+    for host in scraping.HOST_RATES:
+        scraping.host_buckets.rates[host] = args.rate
+
+    synthetic_dir = None
+    if args.fixtures:
+        store = fixtures.FixtureStore(args.fixtures)
+    else:
+        synthetic_dir = tempfile.mkdtemp(prefix='bench-fixtures-')
+        store = synthesize(synthetic_dir, cities, args.movies, args.theatres)
+    print(f"{len(store)} fixtures, {len(cities)} cities, latency {args.latency}s, error rate {args.error_rate:.0%}")
+
+    server = fixtures.FixtureServer(store, latency=args.latency, jitter=args.jitter, error_rate=args.error_rate).start()
+    fixtures.forward_to(server.url)
+
+    results = {}
+    try:
+        for target in args.targets.split(","):
+            print(f"Running {target}...")
+            metrics = measure(target.strip(), store, server, cities, args)
+            if metrics:
+                results[target.strip()] = metrics
+    finally:
+        fixtures.restore()
+        server.stop()
+        if synthetic_dir:
+            shutil.rmtree(synthetic_dir, ignore_errors=True)
+
+    report(results, COLUMNS, "target", load_baseline(args.compare))
+    print(store.summary())
+
+    if args.output:
+        save_results(args.output, args, results, skip=("output", "compare", "verbose"))
@@ -0,0 +1,223 @@
+import argparse
+import hashlib
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Run from anywhere: python benchmarks/bench_webhook.py
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_DIR, 'api'))
+
+# The webhook refuses to work without these; the stub below never uses them
+os.environ.setdefault('GITHUB_TOKEN', 'bench')
+os.environ.setdefault('GITHUB_REPO', 'bench/movienotify')
+
+from github import GithubException
+import webhook
+from reporting import load_baseline, report, save_results
+
+COMMANDS = {
+    "track": lambda rng, i: f"Track https://in.bookmyshow.com/bengaluru/movies/synthetic-movie-{rng.randint(0, 50)}/ET{90000000 + i}",
+    "status": lambda rng, i: "Status",
+    "help": lambda rng, i: "hello?",
+}
+DEFAULT_MIX = "track=0.5,status=0.4,help=0.1"
+COLUMNS = ["requests", "per_s", "p50_ms", "p95_ms", "p99_ms", "max_ms"]
+
+
+# ===== Stubbed GitHub =====
+
+class StubContent:
+    def __init__(self, data):
+        self.decoded_content = data
+        self.sha = hashlib.sha1(data).hexdigest()
+
+
+class StubRepo:
+    # The two calls the webhook makes, each taking `latency` (+ jitter)
+    # seconds. update_file checks the SHA like GitHub does and answers 409
+    # when it is stale, or at random with `conflict_rate`.
+
+    def __init__(self, latency=0.2, jitter=0.0, conflict_rate=0.0, seed=1):
+        self.latency = latency
+        self.jitter = jitter
+        self.conflict_rate = conflict_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.content = StubContent(json.dumps({"url": "https://in.bookmyshow.com/"}, indent=2).encode())
+        self.reads = 0
+        self.commits = 0
+        self.conflicts = 0
+
+    def wait(self):
+        with self.lock:
+            delay = self.latency + self.rng.uniform(0, self.jitter)
+        if delay:
+            time.sleep(delay)
+
+    def get_contents(self, path):
+        self.wait()
+        with self.lock:
+            self.reads += 1
+            return self.content
+
+    def update_file(self, path, message, content, sha):
+        self.wait()
+        with self.lock:
+            if sha != self.content.sha or self.rng.random() < self.conflict_rate:
+                self.conflicts += 1
+                raise GithubException(409, {"message": "sha does not match"}, None)
+            self.content = StubContent(content.encode())
+            self.commits += 1
+            return {"content": self.content}
+
+    def summary(self):
+        return f"Stub GitHub: {self.reads} reads, {self.commits} commits, {self.conflicts} conflicts"
+
+
+# ===== Load generation =====
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, weight = part.split('=')
+        if name not in COMMANDS:
+            raise SystemExit(f"Unknown command {name!r}, expected one of {', '.join(COMMANDS)}")
+        mix[name] = float(weight)
+    return mix
+
+def workload(count, mix, seed=1):
+    rng = random.Random(seed)
+    names = rng.choices(list(mix), weights=list(mix.values()), k=count)
+    return [(name, COMMANDS[name](rng, i)) for i, name in enumerate(names)]
+
+def test_client_poster():
+    # One Flask test client per worker thread. Client and app share one
+    # GIL here, so with many concurrent senders the tail latencies include
+    # waiting for it; --client http or a lower --concurrency separate that.
+    local = threading.local()
+
+    def post(body):
+        client = getattr(local, 'client', None)
+        if client is None:
+            client = local.client = webhook.app.test_client()
+        response = client.post('/api/webhook', data={'Body': body, 'From': 'whatsapp:+910000000000'})
+        return response.status_code
+    return post, lambda: None
+
+def http_poster():
+    # The app behind a real threaded WSGI server on localhost
+    import requests
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server('127.0.0.1', 0, webhook.app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, name="webhook-server", daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/api/webhook"
+    local = threading.local()
+
+    def post(body):
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        return session.post(url, data={'Body': body, 'From': 'whatsapp:+910000000000'}).status_code
+    return post, server.shutdown
+
+def percentile(ordered, q):
+    # Nearest-rank percentile of an already sorted list
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, max(0, int(round(q * len(ordered))) - 1))]
+
+def summarize(latencies, elapsed):
+    ordered = sorted(latencies)
+    return {
+        "requests": len(ordered),
+        "per_s": round(len(ordered) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(ordered, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(ordered, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(ordered, 0.99) * 1000, 2),
+        "max_ms": round(ordered[-1] * 1000, 2) if ordered else 0.0,
+    }
+
+def run(post, requests_, concurrency):
+    # Returns ({command: [seconds]}, failures, wall time)
+    latencies = {}
+    failures = 0
+    lock = threading.Lock()
+
+    def send(item):
+        nonlocal failures
+        command, body = item
+        started = time.perf_counter()
+        try:
+            ok = post(body) == 200
+        except Exception:
+            ok = False
+        took = time.perf_counter() - started
+        with lock:
+            latencies.setdefault(command, []).append(took)
+            failures += not ok
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        list(pool.map(send, requests_))
+    return latencies, failures, time.perf_counter() - started
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load-test api/webhook.py with synthetic Twilio posts against a stubbed GitHub.")
+    parser.add_argument("--requests", type=int, default=2000, help="synthetic messages to send")
+    parser.add_argument("--concurrency", type=int, default=16, help="messages in flight at once")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="command weights, e.g. " + DEFAULT_MIX)
+    parser.add_argument("--client", choices=["test", "http"], default="test",
+                        help="Flask test client in-process, or a local HTTP server")
+    parser.add_argument("--github-latency", type=float, default=0.2, help="seconds per stubbed GitHub call")
+    parser.add_argument("--github-jitter", type=float, default=0.05)
+    parser.add_argument("--conflict-rate", type=float, default=0.0, help="share of commits answered with 409")
+    parser.add_argument("--cache-ttl", type=float, default=webhook.CACHE_TTL)
+    parser.add_argument("--batch-window", type=float, default=webhook.BATCH_WINDOW)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write results as JSON here")
+    parser.add_argument("--compare", help="previous --output file to diff against")
+    args = parser.parse_args()
+
+    stub = StubRepo(args.github_latency, args.github_jitter, args.conflict_rate, args.seed)
+    webhook._repo = stub
+    webhook.cache.ttl = args.cache_ttl
+    webhook.writer.window = args.batch_window
+
+    post, shutdown = test_client_poster() if args.client == "test" else http_poster()
+    requests_ = workload(args.requests, parse_mix(args.mix), args.seed)
+    print(f"{len(requests_)} messages, {args.concurrency} concurrent, {args.client} client, "
+          f"GitHub latency {args.github_latency}s, cache TTL {args.cache_ttl}s, batch window {args.batch_window}s")
+
+    try:
+        latencies, failures, elapsed = run(post, requests_, args.concurrency)
+    finally:
+        shutdown()
+
+    # Time until every queued Track is committed
+    drain_started = time.perf_counter()
+    webhook.writer.close()
+    drain = time.perf_counter() - drain_started
+
+    results = {command: summarize(values, elapsed) for command, values in sorted(latencies.items())}
+    results["all"] = summarize([t for values in latencies.values() for t in values], elapsed)
+
+    report(results, COLUMNS, "command", load_baseline(args.compare))
+    print(f"\n{failures} failed responses, wall {elapsed:.2f}s, writer drained in {drain:.2f}s")
+    print(webhook.cache.summary())
+    print(webhook.writer.summary())
+    print(stub.summary())
+
+    if args.output:
+        save_results(args.output, args, results, failures=failures, drain_seconds=round(drain, 3),
+                     github={"reads": stub.reads, "commits": stub.commits, "conflicts": stub.conflicts})
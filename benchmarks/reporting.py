@@ -0,0 +1,36 @@
+import datetime
+import json
+
+# Result tables and --output / --compare files shared by the benchmarks:
+# results are {row name: {column: value}}, a saved file keeps them under
+# "results" so any earlier run can serve as the baseline of a later one.
+
+
+def report(results, columns, label, baseline=None):
+    # One row per result; with a baseline every cell also shows its change
+    print(f"{label:>10} " + " ".join(f"{c:>17}" for c in columns))
+    for name, metrics in results.items():
+        cells = []
+        for column in columns:
+            cell = f"{metrics[column]}"
+            old = (baseline or {}).get(name, {}).get(column)
+            if old:
+                cell += f" ({(metrics[column] - old) / old:+.0%})"
+            cells.append(f"{cell:>17}")
+        print(f"{name:>10} " + " ".join(cells))
+
+def load_baseline(path):
+    if not path:
+        return None
+    with open(path, 'r') as f:
+        return json.load(f)["results"]
+
+def save_results(path, args, results, skip=("output", "compare"), **extra):
+    # The run's arguments (minus `skip`) are saved as "config"
+    with open(path, 'w') as f:
+        json.dump(dict({
+            "timestamp": datetime.datetime.now().isoformat(timespec='seconds'),
+            "config": {k: v for k, v in vars(args).items() if k not in skip},
+            "results": results,
+        }, **extra), f, indent=2)
+    print(f"Saved {path}")
@@ -0,0 +1,110 @@
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+from selenium import webdriver
+from selenium.common.exceptions import WebDriverException
+from selenium.webdriver.chrome.options import Options
+
+# Seconds an explicit wait gives a page element before giving up
+WAIT_TIMEOUT = 10
+
+USER_AGENT = 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+
+
+def chrome_options():
+    options = Options()
+    options.add_argument('--headless')
+    options.add_argument('--no-sandbox')
+    options.add_argument('--disable-dev-shm-usage')
+    options.add_argument(f'user-agent={USER_AGENT}')
+    return options
+
+
+class BrowserPool:
+    # Keeps up to `size` headless Chrome drivers warm across cities.
+    # session() hands out an idle driver (starting one only if none is
+    # idle) and wipes cookies and storage when it comes back, so the next
+    # city starts clean without paying for another browser launch.
+
+    def __init__(self, size=1):
+        self.size = max(1, size)
+        self.idle = queue.Queue()
+        self.drivers = []
+        self.lock = threading.Lock()
+
+        self.startup_time = 0.0
+        self.session_time = 0.0
+        self.sessions = 0
+
+    def _start(self):
+        started = time.monotonic()
+        driver = webdriver.Chrome(options=chrome_options())
+        with self.lock:
+            self.startup_time += time.monotonic() - started
+            self.drivers.append(driver)
+        return driver
+
+    def _checkout(self):
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self.lock:
+            can_start = len(self.drivers) < self.size
+        return self._start() if can_start else self.idle.get()
+
+    def _discard(self, driver):
+        with self.lock:
+            if driver in self.drivers:
+                self.drivers.remove(driver)
+        try:
+            driver.quit()
+        except WebDriverException:
+            pass
+
+    def reset(self, driver):
+        # Storage is per origin, so clear it before leaving the page
+        driver.execute_script('window.localStorage.clear(); window.sessionStorage.clear();')
+        driver.delete_all_cookies()
+        driver.get('about:blank')
+
+    @contextmanager
+    def session(self):
+        driver = self._checkout()
+        started = time.monotonic()
+        try:
+            yield driver
+        finally:
+            with self.lock:
+                self.session_time += time.monotonic() - started
+                self.sessions += 1
+            try:
+                self.reset(driver)
+            except WebDriverException as e:
+                # A crashed or wedged browser is replaced on the next checkout
+                print(f"  Dropping browser after failed reset: {e}")
+                self._discard(driver)
+            else:
+                self.idle.put(driver)
+
+    def close(self):
+        with self.lock:
+            drivers, self.drivers = self.drivers, []
+        for driver in drivers:
+            try:
+                driver.quit()
+            except WebDriverException:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def summary(self):
+        per_city = self.session_time / self.sessions if self.sessions else 0.0
+        return (f"Browser pool: {self.startup_time:.1f}s startup, "
+                f"{self.sessions} cities in {self.session_time:.1f}s ({per_city:.1f}s per city)")
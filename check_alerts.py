@@ -1,87 +1,83 @@
+import argparse
 import sqlite3
-import os
 import re
-import requests
-from twilio.rest import Client
-from database import get_db_connection
-
-# Twilio Configuration
-TWILIO_ACCOUNT_SID = os.environ.get('TWILIO_ACCOUNT_SID')
-TWILIO_AUTH_TOKEN = os.environ.get('TWILIO_AUTH_TOKEN')
-TWILIO_FROM = os.environ.get('TWILIO_FROM_WHATSAPP')
-TWILIO_TO = os.environ.get('TWILIO_TO_WHATSAPP')
+from alert_store import GITHUB_SOURCE, sync_from_url, alert_cities, load_alerts
+from database import get_db_connection, init_db, match_titles, alert_key, match_hash, should_notify, record_notification
+from metrics import metrics
+from notifier import DigestBatch, get_dispatcher
+from profiling import add_arguments as add_profile_arguments, profiled
+from showtimes import ShowtimeIndex, compile_time_filters
 
 # GitHub Configuration
 GITHUB_REPO = "phanindrasai27/movienotify"
 ALERTS_URL = f"https://raw.githubusercontent.com/{GITHUB_REPO}/main/alerts.json"
 
-def send_whatsapp(message):
-    if not all([TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, TWILIO_FROM, TWILIO_TO]):
-        print("Twilio credentials missing. Skipping notification.")
-        print(f"Message: {message}")
-        return
+def fetch_alerts_from_github():
+    # Syncs the local alert store with alerts.json (a 304 when unchanged)
+    # and returns the cities with active alerts; check_alerts then loads
+    # them one city at a time. If GitHub can't be reached the alerts of the
+    # last successful sync are used.
+    sync_from_url(ALERTS_URL, GITHUB_SOURCE)
+    return alert_cities(GITHUB_SOURCE)
 
-    try:
-        client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
-        msg = client.messages.create(
-            body=message,
-            from_=TWILIO_FROM,
-            to=TWILIO_TO
-        )
-        print(f"WhatsApp sent: {msg.sid}")
-    except Exception as e:
-        print(f"Error sending WhatsApp: {e}")
+def showtime_indexes(cursor, movie_ids):
+    # One ShowtimeIndex per movie, built from its rows in the showtimes table
+    if not movie_ids:
+        return {}
+    placeholders = ','.join('?' * len(movie_ids))
+    cursor.execute(f'SELECT movie_id, show_time FROM showtimes WHERE movie_id IN ({placeholders})', movie_ids)
 
-def fetch_alerts_from_github():
-    try:
-        response = requests.get(ALERTS_URL)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            print(f"Failed to fetch alerts.json: {response.status_code}")
-            return []
-    except Exception as e:
-        print(f"Error fetching alerts: {e}")
-        return []
+    times = {}
+    for row in cursor.fetchall():
+        times.setdefault(row['movie_id'], []).append(row['show_time'])
+    return {movie_id: ShowtimeIndex.from_times(t) for movie_id, t in times.items()}
 
-def check_alerts():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Get alerts from GitHub
-    alerts = fetch_alerts_from_github()
-    
-    if not alerts:
-        print("No alerts found.")
-        return
+def check_city(conn, cursor, city, digest):
+    # Matches every alert of one city, adding hits to `digest`. Loading
+    # them per city is what idx_alerts_city (source, is_active, city,
+    # position) on the alerts table serves.
+    alerts = load_alerts(GITHUB_SOURCE, city=city)
 
-    for alert in alerts:
+    # Resolve all title patterns of the city in one query
+    patterns = {}
+    for index, alert in enumerate(alerts):
         movie_name = alert.get('name')
-        city = alert.get('city')
-        filters = alert.get('filters', [])
-        
-        print(f"\nChecking alert: {movie_name} in {city}")
-        
-        # Build query to find matching movies
-        query = 'SELECT m.title, m.slug FROM movies m WHERE 1=1'
-        params = []
-        
         # Match movie name (partial match)
         if movie_name and movie_name != "Custom Link":
-            query += ' AND LOWER(m.title) LIKE LOWER(?)'
-            params.append(f"%{movie_name}%")
+            patterns[index] = movie_name
+    matches = match_titles(conn, city, patterns)
+
+    # Alerts without a name match every movie in the city
+    if len(patterns) < len(alerts):
+        query = 'SELECT m.id, m.title, m.slug, m.city FROM movies m'
+        cursor.execute(query + (' WHERE m.city = ?' if city else ''), [city] if city else [])
+        everything = cursor.fetchall()
+        for index in range(len(alerts)):
+            if index not in patterns:
+                matches[index] = everything
+
+    for index, alert in enumerate(alerts):
+        movie_name = alert.get('name')
+        filters = alert.get('filters', [])
         
-        # Match city
-        if city:
-            query += ' AND m.city = ?'
-            params.append(city)
+        print(f"\nChecking alert: {movie_name} in {city}")
         
-        cursor.execute(query, params)
-        results = cursor.fetchall()
+        results = matches.get(index, [])
+
+        # TIME filters only rule out movies we actually have showtimes for
+        time_filters = [f.split(':')[1] for f in filters if f.startswith('TIME:')]
+        if results and time_filters:
+            time_mask = compile_time_filters(time_filters)
+            indexes = showtime_indexes(cursor, [row['id'] for row in results])
+            results = [
+                row for row in results
+                if not indexes.get(row['id']) or indexes[row['id']].matches(time_mask)
+            ]
         
         if results:
             # Found matching movies!
             msg_lines = [f"🎬 Alert! Found tickets for '{movie_name}' in {city}:"]
+            matched = []
             
             for row in results:
                 title = row['title']
@@ -95,20 +91,56 @@ def check_alerts():
                 
                 msg_lines.append(f"\n*{title}*")
                 msg_lines.append(f"🔗 {url}")
+                matched.append(url)
                 
                 # Check filters if specified
                 if filters:
                     msg_lines.append(f"Filters: {', '.join(filters)}")
             
+            # Skip if these exact matches were already sent within the cooldown
+            key, match_digest = alert_key(alert), match_hash(matched)
+            if not should_notify(conn, key, match_digest):
+                print(f"Already notified for: {movie_name}")
+                continue
+
             message = "\n".join(msg_lines)
-            send_whatsapp(message)
-            print(f"✅ Notification sent for: {movie_name}")
+            digest.add(None, message, tag=(movie_name, key, match_digest))
         else:
             print(f"No matches found for: {movie_name}")
+
+def check_alerts():
+    init_db()
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    # Cities with alerts from GitHub
+    cities = fetch_alerts_from_github()
+    
+    if not cities:
+        print("No alerts found.")
+        return
+
+    # All matches of this run go out as one digest to TWILIO_TO_WHATSAPP
+    digest = DigestBatch()
+
+    for city in cities:
+        check_city(conn, cursor, city, digest)
+
+    for tags, futures in digest.send(get_dispatcher()):
+        if all(f.result() for f in futures):
+            for movie_name, key, match_digest in tags:
+                record_notification(conn, key, match_digest)
+                print(f"✅ Notification sent for: {movie_name}")
+    print(get_dispatcher().summary())
             
     conn.commit()
     conn.close()
 
 if __name__ == "__main__":
-    check_alerts()
+    parser = argparse.ArgumentParser(description="Match alerts against the scraped showtimes and notify.")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+    with profiled('alerts', args):
+        check_alerts()
+    metrics.write('alerts')
 
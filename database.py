@@ -1,13 +1,182 @@
 import sqlite3
 import os
+import json
+import hashlib
+import atexit
+import threading
+import time
+
+from metrics import metrics
 
 DB_FILE = 'data/movies.db'
 
+# Applied to every new connection. WAL lets readers run alongside one
+# writer, busy_timeout makes writers queue instead of failing with
+# "database is locked".
+CONNECTION_PRAGMAS = [
+    'PRAGMA journal_mode = WAL',
+    'PRAGMA synchronous = NORMAL',
+    'PRAGMA busy_timeout = 10000',
+    'PRAGMA cache_size = -20000',
+    'PRAGMA mmap_size = 268435456',
+    'PRAGMA temp_store = MEMORY',
+]
+
+# Schema changes applied in order by init_db, tracked in PRAGMA user_version
+MIGRATIONS = [
+    # 1: secondary indexes for per-city reads and showtime lookups
+    [
+        'CREATE INDEX IF NOT EXISTS idx_movies_city ON movies (city)',
+        'CREATE INDEX IF NOT EXISTS idx_theatres_city ON theatres (city)',
+        'CREATE INDEX IF NOT EXISTS idx_showtimes_movie_date ON showtimes (movie_id, show_date)',
+    ],
+    # 2: per-city JSON fragments of the last metadata export (metadata_export.py)
+    [
+        '''CREATE TABLE IF NOT EXISTS export_state (
+            target TEXT NOT NULL,
+            city TEXT NOT NULL,
+            content_hash TEXT NOT NULL,
+            fragment TEXT NOT NULL,
+            PRIMARY KEY (target, city)
+        ) WITHOUT ROWID''',
+    ],
+    # 3: per-session format and language from District's __NEXT_DATA__
+    [
+        'ALTER TABLE showtimes ADD COLUMN format TEXT',
+        'ALTER TABLE showtimes ADD COLUMN language TEXT',
+    ],
+    # 4: alerts.json materialized per source, plus what was last synced (alert_store.py)
+    [
+        '''CREATE TABLE IF NOT EXISTS alerts (
+            source TEXT NOT NULL,
+            alert_key TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            city TEXT,
+            movie TEXT,
+            url TEXT,
+            payload TEXT NOT NULL,
+            is_active BOOLEAN NOT NULL DEFAULT 1,
+            PRIMARY KEY (source, alert_key)
+        ) WITHOUT ROWID''',
+        'CREATE INDEX IF NOT EXISTS idx_alerts_city_movie ON alerts (source, is_active, city, movie)',
+        'CREATE INDEX IF NOT EXISTS idx_alerts_url ON alerts (source, is_active, url)',
+        '''CREATE TABLE IF NOT EXISTS alert_sources (
+            source TEXT PRIMARY KEY,
+            etag TEXT,
+            blob_sha TEXT,
+            mtime REAL,
+            size INTEGER,
+            synced_at DATETIME
+        ) WITHOUT ROWID''',
+    ],
+    # 5: sessions are unique per format too, so a 2D and an IMAX show at the
+    # same time are both kept. SQLite can't change a table constraint, so
+    # the table is rebuilt without it; the unique index treats a missing
+    # format as '' so format-less rows still collapse on INSERT OR IGNORE.
+    [
+        '''CREATE TABLE showtimes_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            movie_id INTEGER,
+            theatre_id INTEGER,
+            show_date TEXT NOT NULL, -- YYYY-MM-DD
+            show_time TEXT NOT NULL,
+            link TEXT,
+            format TEXT,
+            language TEXT,
+            FOREIGN KEY (movie_id) REFERENCES movies (id),
+            FOREIGN KEY (theatre_id) REFERENCES theatres (id)
+        )''',
+        '''INSERT INTO showtimes_new (id, movie_id, theatre_id, show_date, show_time, link, format, language)
+            SELECT id, movie_id, theatre_id, show_date, show_time, link, format, language FROM showtimes''',
+        'DROP TABLE showtimes',
+        'ALTER TABLE showtimes_new RENAME TO showtimes',
+        '''CREATE UNIQUE INDEX IF NOT EXISTS idx_showtimes_session
+            ON showtimes (movie_id, theatre_id, show_date, show_time, IFNULL(format, ''))''',
+        'CREATE INDEX IF NOT EXISTS idx_showtimes_movie_date ON showtimes (movie_id, show_date)',
+    ],
+    # 6: alerts are loaded per city in file order (check_alerts.py); SQLite
+    # preferred the primary key over the (..., city, movie) index for that
+    # query, this one also covers the ORDER BY position
+    [
+        'DROP INDEX IF EXISTS idx_alerts_city_movie',
+        'CREATE INDEX IF NOT EXISTS idx_alerts_city ON alerts (source, is_active, city, position)',
+    ],
+    # 7: NOW_SHOWING / COMING_SOON from the BMS listings, exported to
+    # metadata.json for monitor_daemon's polling intervals
+    [
+        'ALTER TABLE movies ADD COLUMN status TEXT',
+    ],
+    # 8: the BMS crawler stored "7:30 PM" where everything else stores
+    # "07:30 PM"; pad those, dropping rows that then duplicate a padded one
+    [
+        "UPDATE OR IGNORE showtimes SET show_time = '0' || show_time WHERE show_time GLOB '[0-9]:*'",
+        "DELETE FROM showtimes WHERE show_time GLOB '[0-9]:*'",
+    ],
+]
+
+# An alert whose matches haven't changed is re-sent at most this often
+NOTIFY_COOLDOWN_HOURS = float(os.environ.get('NOTIFY_COOLDOWN_HOURS', 24))
+
+class PooledConnection(sqlite3.Connection):
+    # Connection handed out by get_db_connection. close() returns it to the
+    # pool; like a real close it discards uncommitted work, but only once
+    # the outermost caller in this thread is done with it.
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+
+    def close(self):
+        self.checkouts = max(0, self.checkouts - 1)
+        if self.checkouts == 0 and self.in_transaction:
+            self.rollback()
+
+    def release(self):
+        super().close()
+
+_local = threading.local()
+_pool = []
+_pool_lock = threading.Lock()
+
 def get_db_connection():
-    conn = sqlite3.connect(DB_FILE)
-    conn.row_factory = sqlite3.Row
+    # One reusable connection per thread and database file
+    connections = getattr(_local, 'connections', None)
+    if connections is None:
+        connections = _local.connections = {}
+
+    conn = connections.get(DB_FILE)
+    if conn is None:
+        conn = sqlite3.connect(DB_FILE, factory=PooledConnection)
+        conn.row_factory = sqlite3.Row
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        connections[DB_FILE] = conn
+        with _pool_lock:
+            _pool.append(conn)
+
+    conn.checkouts += 1
     return conn
 
+@atexit.register
+def close_all_connections():
+    # Really closes every pooled connection, which also checkpoints the WAL
+    with _pool_lock:
+        for conn in _pool:
+            try:
+                conn.release()
+            except sqlite3.Error:
+                pass
+        _pool.clear()
+    _local.__dict__.clear()
+
+def migrate(cursor):
+    version = cursor.execute('PRAGMA user_version').fetchone()[0]
+    for number, statements in enumerate(MIGRATIONS[version:], version + 1):
+        for statement in statements:
+            cursor.execute(statement)
+        cursor.execute(f'PRAGMA user_version = {number}')
+        print(f"Applied schema migration {number}")
+
 def init_db():
     if not os.path.exists('data'):
         os.makedirs('data')
@@ -67,9 +236,136 @@ def init_db():
         )
     ''')
     
+    # Last notification per alert, keyed by a hash of the alert itself.
+    # match_hash fingerprints what was matched (URLs, showtimes) so a
+    # changed result is sent again immediately.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS notification_state (
+            alert_key TEXT PRIMARY KEY,
+            match_hash TEXT NOT NULL,
+            last_notified_at DATETIME NOT NULL
+        ) WITHOUT ROWID
+    ''')
+
+    init_title_index(cursor)
+    migrate(cursor)
+    
     conn.commit()
     conn.close()
     print(f"Database initialized at {DB_FILE}")
 
+# Normalized form of movies.title stored in the title index
+NORMALIZED_TITLE = "lower(trim(CASE WHEN {col} LIKE 'Book %' THEN substr({col}, 6) ELSE {col} END))"
+
+def init_title_index(cursor):
+    # Trigram FTS5 index over normalized titles, rowid = movies.id. The
+    # triggers keep it in sync with every writer of the movies table.
+    try:
+        cursor.execute("CREATE VIRTUAL TABLE IF NOT EXISTS movie_titles USING fts5(title, tokenize='trigram')")
+    except sqlite3.OperationalError as e:
+        print(f"Title index unavailable, falling back to LIKE scans: {e}")
+        return
+
+    new_title = NORMALIZED_TITLE.format(col='new.title')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS movies_title_insert AFTER INSERT ON movies BEGIN
+            INSERT INTO movie_titles (rowid, title) VALUES (new.id, {new_title});
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS movies_title_update AFTER UPDATE OF title ON movies BEGIN
+            UPDATE movie_titles SET title = {new_title} WHERE rowid = new.id;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS movies_title_delete AFTER DELETE ON movies BEGIN
+            DELETE FROM movie_titles WHERE rowid = old.id;
+        END
+    ''')
+
+    # Backfill rows written before the index existed
+    cursor.execute(f'''
+        INSERT INTO movie_titles (rowid, title)
+        SELECT id, {NORMALIZED_TITLE.format(col='title')} FROM movies
+        WHERE id NOT IN (SELECT rowid FROM movie_titles)
+    ''')
+
+def has_title_index(conn):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'movie_titles'").fetchone() is not None
+
+def match_titles(conn, city, patterns):
+    # Resolves {key: title pattern} for one city (None = any city) in a
+    # single query by joining a temp table of patterns against the title
+    # index. Returns {key: [movie rows]}, rows ordered by movie id.
+    if not patterns:
+        return {}
+
+    keys = list(patterns)
+    conn.execute('CREATE TEMP TABLE IF NOT EXISTS alert_patterns (idx INTEGER PRIMARY KEY, pattern TEXT NOT NULL)')
+    conn.execute('DELETE FROM alert_patterns')
+    conn.executemany(
+        'INSERT INTO alert_patterns (idx, pattern) VALUES (?, ?)',
+        [(i, patterns[key].lower()) for i, key in enumerate(keys)]
+    )
+
+    city_clause = 'AND m.city = ?' if city else ''
+    city_params = [city] if city else []
+
+    # Trigrams need at least 3 characters, shorter patterns use a plain scan
+    scan = f'''
+        SELECT p.idx, m.id, m.title, m.slug, m.city
+        FROM alert_patterns p JOIN movies m ON instr({NORMALIZED_TITLE.format(col='m.title')}, p.pattern) > 0
+        WHERE {{length_clause}} {city_clause}
+    '''
+    if has_title_index(conn):
+        query = f'''
+            SELECT p.idx, m.id, m.title, m.slug, m.city
+            FROM alert_patterns p
+            JOIN movie_titles t ON movie_titles MATCH '"' || replace(p.pattern, '"', '""') || '"'
+            JOIN movies m ON m.id = t.rowid
+            WHERE length(p.pattern) >= 3 {city_clause}
+            UNION ALL
+            {scan.format(length_clause='length(p.pattern) < 3')}
+            ORDER BY 1, 2
+        '''
+        params = city_params * 2
+    else:
+        query = scan.format(length_clause='1') + ' ORDER BY 1, 2'
+        params = city_params
+
+    matches = {}
+    for row in conn.execute(query, params).fetchall():
+        matches.setdefault(keys[row['idx']], []).append(row)
+    conn.execute('DELETE FROM alert_patterns')
+    return matches
+
+def alert_key(alert):
+    return hashlib.sha1(json.dumps(alert, sort_keys=True).encode()).hexdigest()
+
+def match_hash(matches):
+    return hashlib.sha1(json.dumps(sorted(matches, key=str)).encode()).hexdigest()
+
+def should_notify(conn, key, digest, cooldown_hours=NOTIFY_COOLDOWN_HOURS):
+    row = conn.execute('''
+        SELECT match_hash, last_notified_at > datetime('now', ?) AS recent
+        FROM notification_state WHERE alert_key = ?
+    ''', (f'-{cooldown_hours} hours', key)).fetchone()
+    if row is None:
+        return True
+    return row['match_hash'] != digest or not row['recent']
+
+def record_notification(conn, key, digest):
+    started = time.perf_counter()
+    conn.execute('''
+        INSERT INTO notification_state (alert_key, match_hash, last_notified_at)
+        VALUES (?, ?, datetime('now'))
+        ON CONFLICT(alert_key) DO UPDATE SET
+            match_hash = excluded.match_hash,
+            last_notified_at = excluded.last_notified_at
+    ''', (key, digest))
+    conn.commit()
+    metrics.observe('db_write_seconds', time.perf_counter() - started, stage='notification_state')
+    metrics.record_rows('notification_state', 1)
+
 if __name__ == "__main__":
     init_db()
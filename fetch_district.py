@@ -1,10 +1,9 @@
-import cloudscraper
+import argparse
 import json
 import os
 import time
 import re
 import sqlite3
-from bs4 import BeautifulSoup
 from database import get_db_connection
 
 # Configuration
@@ -12,93 +11,131 @@ DATA_DIR = 'data'
 CITIES_FILE = os.path.join(DATA_DIR, 'cities.json')
 METADATA_FILE = os.path.join(DATA_DIR, 'district_metadata.json')
 
-import cloudscraper
 import json
 import os
 import time
 import re
 import sqlite3
-from bs4 import BeautifulSoup
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
+from selenium.common.exceptions import TimeoutException
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.common.keys import Keys
-from database import get_db_connection
+from database import get_db_connection, init_db
+from metadata_export import distinct_values, export_metadata as export_metadata_file
+from browser_pool import BrowserPool, WAIT_TIMEOUT
+from scraping import memo
+from metrics import metrics
+from profiling import add_arguments as add_profile_arguments, profiled, working_on
+from next_data import slice_next_data, loads, page_title, extract_showtimes, most_common
 
 # Configuration
 DATA_DIR = 'data'
 CITIES_FILE = os.path.join(DATA_DIR, 'cities.json')
 METADATA_FILE = os.path.join(DATA_DIR, 'district_metadata.json')
 
-scraper = cloudscraper.create_scraper()
-
 def load_cities():
     if os.path.exists(CITIES_FILE):
         with open(CITIES_FILE, 'r') as f:
             return json.load(f)
     return []
 
+# Seconds to wait for more movie cards after scrolling to the bottom
+SCROLL_TIMEOUT = 2
+
+# Showtime rows per executemany call
+SHOWTIME_BATCH_SIZE = 5000
+
+def load_ids(cursor, table, key, city_name):
+    cursor.execute(f'SELECT {key}, id FROM {table} WHERE city = ?', (city_name,))
+    return {row[0]: row[1] for row in cursor.fetchall()}
+
 def save_to_db(city_name, movies_data):
     conn = get_db_connection()
     cursor = conn.cursor()
     
     print(f"  Saving {len(movies_data)} movies to DB...")
-    
-    for movie in movies_data:
-        # 1. Insert/Get Movie
-        cursor.execute('''
-            INSERT OR IGNORE INTO movies (title, slug, city, language, format)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (movie['title'], movie['slug'], city_name, movie.get('language'), movie.get('format')))
-        
-        # Get ID
-        cursor.execute('SELECT id FROM movies WHERE slug = ? AND city = ?', (movie['slug'], city_name))
-        res = cursor.fetchone()
-        if not res: continue
-        movie_id = res[0]
-        
-        # 2. Process Showtimes
-        for show in movie.get('showtimes', []):
-            theatre_name = show['theatre']
-            theatre_slug = re.sub(r'[^a-zA-Z0-9]', '', theatre_name.lower())
-            
-            # Insert/Get Theatre
-            cursor.execute('''
+    started = time.perf_counter()
+    written = {'movies': 0, 'theatres': 0, 'showtimes': 0}
+
+    try:
+        # 1. Insert new movies, then map slug -> id for the whole city
+        movie_ids = load_ids(cursor, 'movies', 'slug', city_name)
+        new_movies = {}
+        for movie in movies_data:
+            if movie['slug'] not in movie_ids and movie['slug'] not in new_movies:
+                new_movies[movie['slug']] = (movie['title'], movie['slug'], city_name, movie.get('language'), movie.get('format'))
+        if new_movies:
+            cursor.executemany('''
+                INSERT OR IGNORE INTO movies (title, slug, city, language, format)
+                VALUES (?, ?, ?, ?, ?)
+            ''', list(new_movies.values()))
+            written['movies'] = cursor.rowcount
+            movie_ids = load_ids(cursor, 'movies', 'slug', city_name)
+
+        # 2. Same for every theatre referenced by a showtime
+        theatre_ids = load_ids(cursor, 'theatres', 'name', city_name)
+        new_theatres = {}
+        for movie in movies_data:
+            for show in movie.get('showtimes', []):
+                theatre_name = show['theatre']
+                if theatre_name not in theatre_ids and theatre_name not in new_theatres:
+                    theatre_slug = re.sub(r'[^a-zA-Z0-9]', '', theatre_name.lower())
+                    new_theatres[theatre_name] = (theatre_name, city_name, theatre_slug)
+        if new_theatres:
+            cursor.executemany('''
                 INSERT OR IGNORE INTO theatres (name, city, slug)
                 VALUES (?, ?, ?)
-            ''', (theatre_name, city_name, theatre_slug))
-            
-            cursor.execute('SELECT id FROM theatres WHERE name = ? AND city = ?', (theatre_name, city_name))
-            t_res = cursor.fetchone()
-            if not t_res: continue
-            theatre_id = t_res[0]
-            
-            # Insert Showtime
-            cursor.execute('''
-                INSERT OR IGNORE INTO showtimes (movie_id, theatre_id, show_date, show_time, link)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (movie_id, theatre_id, show['date'], show['time'], show.get('link')))
-            
-    conn.commit()
-    conn.close()
+            ''', list(new_theatres.values()))
+            written['theatres'] = cursor.rowcount
+            theatre_ids = load_ids(cursor, 'theatres', 'name', city_name)
+
+        # 3. Showtimes in batches, ids resolved from the maps above
+        batch = []
+        for movie in movies_data:
+            movie_id = movie_ids.get(movie['slug'])
+            if movie_id is None: continue
+            for show in movie.get('showtimes', []):
+                theatre_id = theatre_ids.get(show['theatre'])
+                if theatre_id is None: continue
+                batch.append((movie_id, theatre_id, show['date'], show['time'], show.get('link'), show.get('format'), show.get('language')))
+                if len(batch) >= SHOWTIME_BATCH_SIZE:
+                    written['showtimes'] += insert_showtimes(cursor, batch)
+                    batch = []
+        written['showtimes'] += insert_showtimes(cursor, batch)
+
+        # One transaction per city
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    metrics.observe('db_write_seconds', time.perf_counter() - started, stage='district')
+    for table, count in written.items():
+        metrics.record_rows(table, count)
     print(f"  Saved data for {city_name} to DB.")
 
-def get_movie_urls_selenium(city_name):
-    print(f"  Discovering movies for {city_name} via Selenium...")
-    options = Options()
-    options.add_argument('--headless')
-    options.add_argument('--no-sandbox')
-    options.add_argument('--disable-dev-shm-usage')
-    options.add_argument('user-agent=Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36')
+def insert_showtimes(cursor, rows):
+    if rows:
+        cursor.executemany('''
+            INSERT OR IGNORE INTO showtimes (movie_id, theatre_id, show_date, show_time, link, format, language)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', rows)
+        return cursor.rowcount
+    return 0
 
-    driver = webdriver.Chrome(options=options)
+def movie_links(driver):
+    return driver.find_elements(By.XPATH, "//a[contains(@href, '/movies/') and contains(@href, '-movie-tickets-in-')]")
+
+def get_movie_urls_selenium(city_name, driver):
+    print(f"  Discovering movies for {city_name} via Selenium...")
+    wait = WebDriverWait(driver, WAIT_TIMEOUT)
     movie_urls = set()
     
     try:
         driver.get("https://www.district.in/")
-        time.sleep(3)
+        wait.until(EC.presence_of_element_located((By.TAG_NAME, "button")))
         
         # 1. Select City
         print("  Selecting city...")
@@ -139,22 +176,27 @@ def get_movie_urls_selenium(city_name):
                 
             if location_btn:
                 location_btn.click()
-                time.sleep(1)
                 
-                # Type in input
-                inputs = driver.find_elements(By.TAG_NAME, "input")
-                if inputs:
+                # Type in input once the modal has rendered it
+                try:
+                    city_input = wait.until(EC.element_to_be_clickable((By.TAG_NAME, "input")))
+                except TimeoutException:
+                    city_input = None
+                if city_input:
                     print(f"  Typing {city_name}...")
-                    inputs[0].send_keys(city_name)
-                    time.sleep(1)
+                    city_input.send_keys(city_name)
                     
                     # Click Result
                     # Look for div with aria-label=city_name
-                    results = driver.find_elements(By.XPATH, f"//div[@aria-label='{city_name}']")
-                    if results:
+                    try:
+                        result = wait.until(EC.element_to_be_clickable((By.XPATH, f"//div[@aria-label='{city_name}']")))
+                    except TimeoutException:
+                        result = None
+                    if result:
                         print("  Clicking result...")
-                        results[0].click()
-                        time.sleep(3)
+                        result.click()
+                        # The modal closes once the city is applied
+                        wait.until(EC.staleness_of(result))
                     else:
                         print("  City result not found in dropdown.")
             else:
@@ -169,179 +211,167 @@ def get_movie_urls_selenium(city_name):
             # Click "Movies" link
             movies_link = driver.find_element(By.XPATH, "//a[contains(text(), 'Movies')]")
             movies_link.click()
-            time.sleep(3)
+            wait.until(lambda d: movie_links(d))
         except:
             # Fallback: Force URL
             driver.get("https://www.district.in/movies/")
-            time.sleep(3)
+            try:
+                wait.until(lambda d: movie_links(d))
+            except TimeoutException:
+                pass
         
         # 3. Extract Links
         print("  Extracting links...")
-        # Scroll down to load more
-        driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-        time.sleep(2)
+        # Scroll down to load more, until no new cards show up
+        loaded = len(movie_links(driver))
+        while True:
+            driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
+            try:
+                WebDriverWait(driver, SCROLL_TIMEOUT).until(lambda d: len(movie_links(d)) > loaded)
+            except TimeoutException:
+                break
+            loaded = len(movie_links(driver))
         
-        links = driver.find_elements(By.TAG_NAME, "a")
-        for a in links:
+        for a in movie_links(driver):
             href = a.get_attribute('href')
-            if href and '/movies/' in href and '-movie-tickets-in-' in href:
+            if href:
                 # Filter for city if possible
                 if city_name.lower() in href.lower():
                     movie_urls.add(href)
                     
     except Exception as e:
         print(f"  Selenium Error: {e}")
-    finally:
-        driver.quit()
-        
+                
     return list(movie_urls)
 
 def fetch_movie_details(url, city_name):
     try:
-        resp = scraper.get(url)
+        resp = memo.get(url, city_name)
         if resp.status_code != 200: return None
         
-        soup = BeautifulSoup(resp.text, 'html.parser')
-        next_data = soup.find('script', id='__NEXT_DATA__')
+        # Work on the raw bytes: slice out the __NEXT_DATA__ JSON instead of
+        # building a DOM for the whole page
+        body = resp.content
+        payload = slice_next_data(body)
         
-        if next_data:
-            data = json.loads(next_data.string)
-            props = data.get('props', {}).get('pageProps', {})
-            
-            # Extract Movie Info
-            initial_state = props.get('initialState', {})
+        if payload:
+            with metrics.timer('parse_seconds', stage='next_data'), working_on(url):
+                data = loads(payload)
             
-            title = soup.title.string.split('|')[0].strip() if soup.title else "Unknown"
+            title = page_title(body) or "Unknown"
+            title = title.split('|')[0].strip()
             title = title.split(' Movie Tickets')[0].strip()
             
             slug = url.split('/')[-1]
             
-            showtimes = []
-            
-            # Regex for showtimes
-            times = re.findall(r'\d{1,2}:\d{2}\s(?:AM|PM)', resp.text)
-            unique_times = sorted(list(set(times)))
-            
-            if unique_times:
-                showtimes.append({
-                    "theatre": "Unknown Theatre (Scraped)", 
-                    "time": unique_times[0],
-                    "date": "Today", 
-                    "link": url
-                })
+            # Real sessions: theatre, date, time, format and language
+            showtimes = extract_showtimes(data)
+            language = most_common(show['language'] for show in showtimes) or "Unknown"
+            movie_format = most_common(show['format'] for show in showtimes) or "2D"
+            for show in showtimes:
+                show['link'] = url
+                show['language'] = show['language'] or language
+                show['format'] = show['format'] or movie_format
             
             return {
                 "title": title,
                 "slug": slug,
                 "showtimes": showtimes,
-                "language": "Unknown",
-                "format": "2D"
+                "language": language,
+                "format": movie_format
             }
             
     except Exception as e:
         print(f"  Error fetching details for {url}: {e}")
     return None
 
-def export_metadata():
-    print("Exporting metadata for frontend...")
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    cities = load_cities()
-    metadata = {}
-    
-    for city in cities:
-        city_name = city['name']
+def build_city(city_name, movie_rows, theatre_rows):
+    movies = []
+    for row in movie_rows:
+        # Clean title - remove "Book " prefix if present
+        title = row['title']
+        if title.startswith("Book "):
+            title = title[5:]
         
-        # Get Movies
-        cursor.execute('SELECT * FROM movies WHERE city = ?', (city_name,))
-        movies = []
-        for row in cursor.fetchall():
-            # Clean title - remove "Book " prefix if present
-            title = row['title']
-            if title.startswith("Book "):
-                title = title[5:]
-            
-            # Construct District URL
-            url = f"https://www.district.in/movies/{row['slug']}"
-            
-            # Determine status - if title contains year or certain keywords, mark as re-release
-            # Otherwise default to NOW_SHOWING or COMING_SOON
-            # For now, we'll mark all as NOW_SHOWING since District only shows available movies
-            status = "NOW_SHOWING"
-            
-            movies.append({
-                "title": title,
-                "url": url,
-                "status": status,
-                "city": row['city'],
-                "language": row['language'],
-                "format": row['format']
-            })
-            
-        # Get Theatres
-        cursor.execute('SELECT * FROM theatres WHERE city = ?', (city_name,))
-        theatres = []
-        for row in cursor.fetchall():
-            # Skip "Unknown Theatre" entries
-            if row['name'] == "Unknown Theatre (Scraped)":
-                continue
-                
-            theatres.append({
-                "name": row['name'],
-                "url": f"https://www.district.in/venue/{row['slug']}",  # Construct URL
-                "city": row['city']
-            })
-            
-        # Get unique formats and languages from movies
-        cursor.execute('SELECT DISTINCT format FROM movies WHERE city = ? AND format IS NOT NULL', (city_name,))
-        formats = [r[0] for r in cursor.fetchall() if r[0] and r[0] != "Unknown"]
+        # Construct District URL
+        url = f"https://www.district.in/movies/{row['slug']}"
         
-        cursor.execute('SELECT DISTINCT language FROM movies WHERE city = ? AND language IS NOT NULL', (city_name,))
-        languages = [r[0] for r in cursor.fetchall() if r[0] and r[0] != "Unknown"]
+        # Status scraped from the BMS listings; District itself only shows
+        # available movies
+        status = row['status'] or "NOW_SHOWING"
         
-        metadata[city_name] = {
-            "movies": movies,
-            "theatres": theatres,
-            "filters": {
-                "formats": formats,
-                "languages": languages
-            }
-        }
+        movies.append({
+            "title": title,
+            "url": url,
+            "status": status,
+            "city": row['city'],
+            "language": row['language'],
+            "format": row['format']
+        })
         
-    conn.close()
-    
-    with open(METADATA_FILE, 'w') as f:
-        json.dump(metadata, f, indent=2)
-    print(f"Saved {METADATA_FILE}")
+    theatres = []
+    for row in theatre_rows:
+        # Skip "Unknown Theatre" entries
+        if row['name'] == "Unknown Theatre (Scraped)":
+            continue
+            
+        theatres.append({
+            "name": row['name'],
+            "url": f"https://www.district.in/venue/{row['slug']}",  # Construct URL
+            "city": row['city']
+        })
+        
+    return {
+        "movies": movies,
+        "theatres": theatres,
+        "filters": {
+            "formats": distinct_values(movie_rows, 'format'),
+            "languages": distinct_values(movie_rows, 'language')
+        }
+    }
+
+def export_metadata():
+    print("Exporting metadata for frontend...")
+    export_metadata_file(METADATA_FILE, 'district', load_cities(), build_city)
 
 
 def main():
     cities = load_cities()
-    
-    # Initialize DB
-    for city in cities:
-        city_name = city['name']
-        print(f"Processing {city_name}...")
-        
-        # 1. Get URLs
-        urls = get_movie_urls_selenium(city_name)
-        print(f"  Found {len(urls)} movies.")
-        
-        movies_data = []
-        for url in urls[:10]: # Limit to 10
-            print(f"  Fetching {url}...")
-            details = fetch_movie_details(url, city_name)
-            if details:
-                movies_data.append(details)
-                time.sleep(0.5)
-                
-        # 2. Save to DB
-        if movies_data:
-            save_to_db(city_name, movies_data)
+    init_db()
+    # One warm browser for every city instead of a launch per city; it is
+    # quit even when a city fails
+    with BrowserPool(size=1) as browsers:
+        for city in cities:
+            city_name = city['name']
+            print(f"Processing {city_name}...")
+            
+            # 1. Get URLs
+            with browsers.session() as driver:
+                urls = get_movie_urls_selenium(city_name, driver)
+            print(f"  Found {len(urls)} movies.")
             
+            movies_data = []
+            for url in urls[:10]: # Limit to 10
+                print(f"  Fetching {url}...")
+                details = fetch_movie_details(url, city_name)
+                if details:
+                    movies_data.append(details)
+                    
+            # 2. Save to DB
+            if movies_data:
+                save_to_db(city_name, movies_data)
+            memo.evict(city_name)
+            
+    print(browsers.summary())
+    print(memo.summary())
+    
     # 3. Export
     export_metadata()
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Scrape District movies and showtimes for every city.")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+    with profiled('district', args):
+        main()
+    metrics.write('district')
@@ -1,13 +1,11 @@
-import cloudscraper
-from bs4 import BeautifulSoup
 import json
 import os
 import time
 import re
-import datetime
-
-# Cloudscraper instance
-scraper = cloudscraper.create_scraper()
+from database import init_db
+from fetch_unified import save_movies_to_db
+from scraping import memo
+from theatre_crawler import crawl_theatres, save_crawl
 
 DATA_DIR = 'data'
 CITIES_FILE = os.path.join(DATA_DIR, 'cities.json')
@@ -23,12 +21,12 @@ def fetch_movies_from_url(url, city_name, status):
     print(f"  Fetching {status} for {city_name}...")
     movies = []
     try:
-        response = scraper.get(url)
+        response = memo.get(url, city_name)
         if response.status_code != 200:
             print(f"    Failed to fetch {url}: {response.status_code}")
             return []
             
-        soup = BeautifulSoup(response.text, 'html.parser')
+        soup = memo.soup(url, city_name)
         seen_titles = set()
         
         for a in soup.find_all('a', href=True):
@@ -56,70 +54,12 @@ def fetch_movies_from_url(url, city_name, status):
 
 def fetch_theatres_via_heuristic(city_name, city_code, city_slug, movies):
     print(f"  Fetching theatres for {city_name} (Heuristic)...")
-    theatres = []
-    seen = set()
-    
-    # Try top 3 movies to cover most cinemas
-    target_movies = movies[:3]
-    today = datetime.datetime.now().strftime("%Y%m%d")
-    
-    for movie in target_movies:
-        try:
-            # Construct Booking URL
-            # Movie URL: .../movies/chennai/mastiii-4/ET00464040
-            # Booking URL: .../buytickets/mastiii-4-chennai/movie-chen-ET00464040-MT/20251124
-            
-            parts = movie['url'].split('/')
-            event_code = parts[-1]
-            slug = parts[-2]
-            
-            # Region code logic: usually city code works, but sometimes it's first 4 chars
-            # We'll try city_code first
-            region_part = city_code
-             
-            book_url = f"https://in.bookmyshow.com/buytickets/{slug}-{city_slug}/movie-{region_part}-{event_code}-MT/{today}"
-            
-            print(f"    Checking {book_url}...")
-            resp = scraper.get(book_url)
-            
-            if resp.status_code == 200:
-                soup = BeautifulSoup(resp.text, 'html.parser')
-                
-                # Scrape cinemas
-                count = 0
-                for a in soup.find_all('a', href=True):
-                    if '/cinemas/' in a['href']:
-                        name = a.get_text().strip()
-                        href = a['href']
-                        if name and name not in seen:
-                            theatres.append({
-                                "name": name,
-                                "url": "https://in.bookmyshow.com" + href if not href.startswith('http') else href,
-                                "city": city_name
-                            })
-                            seen.add(name)
-                            count += 1
-                
-                # Fallback: check generic venue classes if no links found
-                if count == 0:
-                     for div in soup.find_all('a', class_='__venue-name'):
-                         name = div.get_text().strip()
-                         if name and name not in seen:
-                             theatres.append({
-                                "name": name,
-                                "url": "", # No URL but name is enough
-                                "city": city_name
-                            })
-                             seen.add(name)
-                             count += 1
-                             
-                print(f"      Found {count} new theatres.")
-            
-            time.sleep(1) # Be polite
-            
-        except Exception as e:
-            print(f"    Error processing movie {movie['title']}: {e}")
-            
+    # Every movie x the next few dates until no new cinemas turn up,
+    # paced per host and memoized by scraping.memo
+    theatres, showtimes = crawl_theatres(memo.scoped(city_name), city_name, city_code, city_slug, movies)
+    if theatres:
+        save_crawl(city_name, theatres, showtimes)
+
     print(f"    Total unique theatres found: {len(theatres)}")
     return theatres
 
@@ -130,11 +70,9 @@ def fetch_filters_for_city(city_name):
     
     url = f"https://in.bookmyshow.com/explore/movies-{city_name.lower()}"
     try:
-        response = scraper.get(url)
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
+        # Same page as the NOW_SHOWING listing, already fetched and parsed
         scraped_formats = set()
-        text_content = soup.get_text()
+        text_content = memo.text(url, city_name)
         
         for fmt in formats:
             if fmt in text_content:
@@ -154,6 +92,7 @@ def fetch_filters_for_city(city_name):
 def main():
     cities = load_cities()
     full_metadata = {}
+    init_db()
 
     for city in cities:
         city_name = city['name']
@@ -170,6 +109,9 @@ def main():
             city_name, "COMING_SOON"
         )
         
+        # Saved first: save_crawl looks showtimes' movies up by slug
+        save_movies_to_db(city_name, now_showing + coming_soon)
+        
         # 2. Theatres (Heuristic)
         # Only use Now Showing movies for heuristic
         theatres = fetch_theatres_via_heuristic(city_name, city_code, city['slug'], now_showing)
@@ -182,9 +124,12 @@ def main():
             "theatres": theatres,
             "filters": filters
         }
+        memo.evict(city_name)
         
         time.sleep(2)
 
+    print(memo.summary())
+
     with open(METADATA_FILE, 'w') as f:
         json.dump(full_metadata, f, indent=2)
         
@@ -1,19 +1,22 @@
-import cloudscraper
-from bs4 import BeautifulSoup
+import argparse
 import json
 import os
 import time
 import re
-import datetime
+from concurrent.futures import ThreadPoolExecutor
 from database import get_db_connection
-
-# Cloudscraper instance
-scraper = cloudscraper.create_scraper()
+from metadata_export import distinct_values, export_metadata as export_metadata_file
+from scraping import memo
+from metrics import metrics
+from profiling import add_arguments as add_profile_arguments, profiled
+from theatre_crawler import crawl_theatres, save_crawl
 
 DATA_DIR = 'data'
 CITIES_FILE = os.path.join(DATA_DIR, 'cities.json')
 METADATA_FILE = os.path.join(DATA_DIR, 'metadata.json')
 
+DEFAULT_WORKERS = int(os.environ.get('FETCH_WORKERS', 4))
+
 def load_cities():
     if os.path.exists(CITIES_FILE):
         with open(CITIES_FILE, 'r') as f:
@@ -26,11 +29,11 @@ def fetch_bms_movies(url, city_name, status):
     print(f"  [BMS] Fetching {status} for {city_name}...")
     movies = []
     try:
-        response = scraper.get(url)
+        response = memo.get(url, city_name)
         if response.status_code != 200:
             return []
             
-        soup = BeautifulSoup(response.text, 'html.parser')
+        soup = memo.soup(url, city_name)
         seen_titles = set()
         
         for a in soup.find_all('a', href=True):
@@ -66,46 +69,9 @@ def fetch_bms_movies(url, city_name, status):
     return movies
 
 def fetch_bms_theatres(city_name, city_code, city_slug, movies):
+    # Every movie x the next CRAWL_DAYS dates, see theatre_crawler
     print(f"  [BMS] Fetching theatres for {city_name}...")
-    theatres = []
-    seen = set()
-    
-    target_movies = movies[:3]
-    today = datetime.datetime.now().strftime("%Y%m%d")
-    
-    for movie in target_movies:
-        try:
-            parts = movie['url'].split('/')
-            event_code = parts[-1]
-            slug = parts[-2]
-            region_part = city_code
-              
-            book_url = f"https://in.bookmyshow.com/buytickets/{slug}-{city_slug}/movie-{region_part}-{event_code}-MT/{today}"
-            
-            resp = scraper.get(book_url)
-            
-            if resp.status_code == 200:
-                soup = BeautifulSoup(resp.text, 'html.parser')
-                
-                for a in soup.find_all('a', href=True):
-                    if '/cinemas/' in a['href']:
-                        name = a.get_text().strip()
-                        href = a['href']
-                        if name and name not in seen:
-                            theatres.append({
-                                "name": name,
-                                "url": "https://in.bookmyshow.com" + href if not href.startswith('http') else href,
-                                "city": city_name
-                            })
-                            seen.add(name)
-            
-            time.sleep(1)
-            
-        except Exception as e:
-            print(f"    [BMS] Error processing {movie['title']}: {e}")
-            
-    print(f"    [BMS] Found {len(theatres)} theatres.")
-    return theatres
+    return crawl_theatres(memo.scoped(city_name), city_name, city_code, city_slug, movies)
 
 def fetch_bms_filters(city_name):
     formats = ["IMAX", "4DX", "2D", "3D", "ICE", "ScreenX", "MX4D"]
@@ -113,11 +79,9 @@ def fetch_bms_filters(city_name):
     
     url = f"https://in.bookmyshow.com/explore/movies-{city_name.lower()}"
     try:
-        response = scraper.get(url)
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
+        # Same page as the NOW_SHOWING listing, already fetched and parsed
         scraped_formats = set()
-        text_content = soup.get_text()
+        text_content = memo.text(url, city_name)
         
         for fmt in formats:
             if fmt in text_content:
@@ -139,6 +103,9 @@ def fetch_bms_filters(city_name):
 def save_movies_to_db(city_name, all_movies):
     conn = get_db_connection()
     cursor = conn.cursor()
+    started = time.perf_counter()
+    inserted = 0
+    seen = set()
     
     for movie in all_movies:
         # Clean title
@@ -152,138 +119,140 @@ def save_movies_to_db(city_name, all_movies):
         else:
             slug = movie['url'].split('/')[-1]
         
-        # Insert movie
+        # Now-showing movies come first, a title also listed as upcoming
+        # keeps that status
+        if slug in seen:
+            continue
+        seen.add(slug)
+        
+        # Insert movie, or move it between COMING_SOON and NOW_SHOWING
         cursor.execute('''
-            INSERT OR IGNORE INTO movies (title, slug, city, language, format)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (title, slug, city_name, movie.get('language', 'Unknown'), movie.get('format', '2D')))
+            INSERT INTO movies (title, slug, city, language, format, status)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(slug, city) DO UPDATE SET status = excluded.status
+            WHERE movies.status IS NOT excluded.status
+        ''', (title, slug, city_name, movie.get('language', 'Unknown'), movie.get('format', '2D'), movie.get('status')))
+        inserted += max(cursor.rowcount, 0)
     
     conn.commit()
     conn.close()
+    metrics.observe('db_write_seconds', time.perf_counter() - started, stage='movies')
+    metrics.record_rows('movies', inserted)
 
-def save_theatres_to_db(city_name, theatres):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    for theatre in theatres:
-        slug = re.sub(r'[^a-zA-Z0-9]', '', theatre['name'].lower())
+def build_city(city_name, movie_rows, theatre_rows):
+    movies = []
+    for row in movie_rows:
+        title = row['title']
+        if title.startswith("Book "):
+            title = title[5:]
         
-        cursor.execute('''
-            INSERT OR IGNORE INTO theatres (name, city, slug)
-            VALUES (?, ?, ?)
-        ''', (theatre['name'], city_name, slug))
+         # Determine URL based on slug pattern
+        slug = row['slug']
+        if slug.startswith('ET') or slug.startswith('MV'):
+            # BMS or District slug
+            if '-' in slug and not slug.startswith('ET'):
+                url = f"https://www.district.in/movies/{slug}"
+            else:
+                # BMS URL - reconstruct
+                url = f"https://in.bookmyshow.com/movies/{city_name.lower()}/{slug}"
+        else:
+            url = f"https://www.district.in/movies/{slug}"
+        
+        movies.append({
+            "title": title,
+            "url": url,
+            "status": row['status'] or "NOW_SHOWING",
+            "city": row['city']
+        })
+        
+    theatres = []
+    for row in theatre_rows:
+        if row['name'] == "Unknown Theatre (Scraped)":
+            continue
+            
+        theatres.append({
+            "name": row['name'],
+            "url": '',  # theatres table has no url column
+            "city": row['city']
+        })
+        
+    formats = distinct_values(movie_rows, 'format')
+    languages = distinct_values(movie_rows, 'language')
     
-    conn.commit()
-    conn.close()
+    return {
+        "movies": movies,
+        "theatres": theatres,
+        "filters": {
+            "formats": formats if formats else ["2D", "3D", "IMAX", "4DX"],
+            "languages": languages if languages else ["English", "Hindi", "Tamil", "Telugu"]
+        }
+    }
 
 def export_metadata():
     print("Exporting unified metadata...")
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    export_metadata_file(METADATA_FILE, 'unified', load_cities(), build_city)
+
+def scrape_city(city):
+    city_name = city['name']
+    city_code = city['code']
+    city_slug = city['slug']
+    print(f"\nProcessing {city_name}...")
     
-    cities = load_cities()
-    metadata = {}
+    # 1. Scrape BMS
+    now_showing = fetch_bms_movies(
+        f"https://in.bookmyshow.com/explore/movies-{city_name.lower()}", 
+        city_name, "NOW_SHOWING"
+    )
+    coming_soon = fetch_bms_movies(
+        f"https://in.bookmyshow.com/explore/upcoming-movies-{city_name.lower()}", 
+        city_name, "COMING_SOON"
+    )
     
-    for city in cities:
-        city_name = city['name']
-        
-        # Get Movies
-        cursor.execute('SELECT * FROM movies WHERE city = ?', (city_name,))
-        movies = []
-        for row in cursor.fetchall():
-            title = row['title']
-            if title.startswith("Book "):
-                title = title[5:]
-            
-             # Determine URL based on slug pattern
-            slug = row['slug']
-            if slug.startswith('ET') or slug.startswith('MV'):
-                # BMS or District slug
-                if '-' in slug and not slug.startswith('ET'):
-                    url = f"https://www.district.in/movies/{slug}"
-                else:
-                    # BMS URL - reconstruct
-                    url = f"https://in.bookmyshow.com/movies/{city_name.lower()}/{slug}"
-            else:
-                url = f"https://www.district.in/movies/{slug}"
-            
-            movies.append({
-                "title": title,
-                "url": url,
-                "status": "NOW_SHOWING",  # Can enhance later
-                "city": row['city']
-            })
-            
-        # Get Theatres
-        cursor.execute('SELECT * FROM theatres WHERE city = ?', (city_name,))
-        theatres = []
-        for row in cursor.fetchall():
-            if row['name'] == "Unknown Theatre (Scraped)":
-                continue
-                
-            theatres.append({
-                "name": row['name'],
-                "url": row.get('url', ''),
-                "city": row['city']
-            })
-            
-        # Get unique formats and languages
-        cursor.execute('SELECT DISTINCT format FROM movies WHERE city = ? AND format IS NOT NULL', (city_name,))
-        formats = [r[0] for r in cursor.fetchall() if r[0] and r[0] != "Unknown"]
-        
-        cursor.execute('SELECT DISTINCT language FROM movies WHERE city = ? AND language IS NOT NULL', (city_name,))
-        languages = [r[0] for r in cursor.fetchall() if r[0] and r[0] != "Unknown"]
-        
-        metadata[city_name] = {
-            "movies": movies,
-            "theatres": theatres,
-            "filters": {
-                "formats": formats if formats else ["2D", "3D", "IMAX", "4DX"],
-                "languages": languages if languages else ["English", "Hindi", "Tamil", "Telugu"]
-            }
-        }
-        
-    conn.close()
+    all_movies = now_showing + coming_soon
     
-    with open(METADATA_FILE, 'w') as f:
-        json.dump(metadata, f, indent=2)
-    print(f"Saved unified metadata to {METADATA_FILE}")
+    # 2. Scrape BMS Theatres and their showtimes
+    theatres, showtimes = fetch_bms_theatres(city_name, city_code, city_slug, now_showing)
+    return all_movies, theatres, showtimes
 
-def main():
+def main(workers=DEFAULT_WORKERS):
     cities = load_cities()
+    started = time.monotonic()
     
-    for city in cities:
-        city_name = city['name']
-        city_code = city['code']
-        city_slug = city['slug']
-        print(f"\nProcessing {city_name}...")
-        
-        # 1. Scrape BMS
-        now_showing = fetch_bms_movies(
-            f"https://in.bookmyshow.com/explore/movies-{city_name.lower()}", 
-            city_name, "NOW_SHOWING"
-        )
-        coming_soon = fetch_bms_movies(
-            f"https://in.bookmyshow.com/explore/upcoming-movies-{city_name.lower()}", 
-            city_name, "COMING_SOON"
-        )
+    # Cities are scraped concurrently, pacing comes from the per-host
+    # buckets. Results are saved in cities.json order so the rows (and ids)
+    # come out the same as a serial run.
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = [pool.submit(scrape_city, city) for city in cities]
         
-        all_movies = now_showing + coming_soon
-        
-        # 2. Scrape BMS Theatres
-        theatres = fetch_bms_theatres(city_name, city_code, city_slug, now_showing)
-        
-        # 3. Save to DB
-        if all_movies:
-            save_movies_to_db(city_name, all_movies)
-        if theatres:
-            save_theatres_to_db(city_name, theatres)
-        
-        print(f"  Total Movies: {len(all_movies)} | Theatres: {len(theatres)}")
-        time.sleep(2)
+        for city, future in zip(cities, futures):
+            city_name = city['name']
+            try:
+                all_movies, theatres, showtimes = future.result()
+            except Exception as e:
+                print(f"  Error processing {city_name}: {e}")
+                continue
+            
+            # 3. Save to DB
+            if all_movies:
+                save_movies_to_db(city_name, all_movies)
+            if theatres:
+                save_crawl(city_name, theatres, showtimes)
+            
+            print(f"  {city_name} Total Movies: {len(all_movies)} | Theatres: {len(theatres)} | Showtimes: {len(showtimes)}")
+            memo.evict(city_name)
+    
+    print(memo.summary())
+    print(f"\nScraped {len(cities)} cities with {workers} workers in {time.monotonic() - started:.1f}s")
     
     # 4. Export final metadata
     export_metadata()
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Scrape BookMyShow movies and theatres for every city.")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="cities scraped concurrently (1 = serial)")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+    with profiled('unified', args):
+        main(args.workers)
+    metrics.write('unified')
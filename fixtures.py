@@ -0,0 +1,304 @@
+import argparse
+import hashlib
+import io
+import json
+import os
+import random
+import runpy
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote, unquote
+
+from requests.adapters import HTTPAdapter
+from urllib3.response import HTTPResponse
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+FIXTURE_DIR = os.path.join(REPO_DIR, 'benchmarks', 'fixtures')
+
+# Served for hosts that have no recorded fixture for a URL. bms_dump.html is
+# the Cloudflare block page BMS answers datacenter IPs (CI runners) with.
+HOST_FALLBACKS = {
+    "in.bookmyshow.com": (403, os.path.join(REPO_DIR, 'bms_dump.html')),
+}
+
+# Response headers worth keeping; bodies are stored decoded, so no encodings
+KEPT_HEADERS = ('Content-Type', 'ETag', 'Last-Modified', 'Location')
+
+
+class FixtureStore:
+    # Recorded GET responses on disk: index.json maps "GET <url>" to status,
+    # headers and a body file named after the body's sha1, so identical
+    # pages are stored once.
+
+    def __init__(self, path=FIXTURE_DIR, fallbacks=HOST_FALLBACKS):
+        self.path = path
+        self.index_file = os.path.join(path, 'index.json')
+        self.fallbacks = fallbacks
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.index = {}
+        if os.path.exists(self.index_file):
+            with open(self.index_file, 'r') as f:
+                self.index = json.load(f)
+
+    @staticmethod
+    def key(method, url):
+        return f"{method.upper()} {url}"
+
+    def __len__(self):
+        return len(self.index)
+
+    def urls(self):
+        return [key.split(' ', 1)[1] for key in self.index]
+
+    def record(self, method, url, status, headers, body, save=True):
+        name = hashlib.sha1(body).hexdigest() + '.body'
+        os.makedirs(self.path, exist_ok=True)
+        body_file = os.path.join(self.path, name)
+        if not os.path.exists(body_file):
+            with open(body_file, 'wb') as f:
+                f.write(body)
+
+        with self.lock:
+            self.index[self.key(method, url)] = {
+                "status": status,
+                "headers": {k: headers[k] for k in KEPT_HEADERS if k in headers},
+                "body": name
+            }
+            if save:
+                self.save()
+
+    def save(self):
+        tmp_file = self.index_file + '.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump(self.index, f, indent=2, sort_keys=True)
+        os.replace(tmp_file, self.index_file)
+
+    def lookup(self, method, url):
+        # (status, headers, body) or None
+        entry = self.index.get(self.key(method, url))
+        if entry is not None:
+            with open(os.path.join(self.path, entry['body']), 'rb') as f:
+                return entry['status'], dict(entry['headers']), f.read()
+
+        host = url.split('/')[2] if '://' in url else ''
+        fallback = self.fallbacks.get(host)
+        if fallback and os.path.exists(fallback[1]):
+            with open(fallback[1], 'rb') as f:
+                return fallback[0], {'Content-Type': 'text/html; charset=UTF-8'}, f.read()
+        return None
+
+    def respond(self, method, url, request_headers):
+        # What a server would send for this request, 304s included
+        found = self.lookup(method, url)
+        with self.lock:
+            if found is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if found is None:
+            return 404, {'Content-Type': 'text/plain'}, f"No fixture for {url}".encode()
+
+        status, headers, body = found
+        etag = headers.setdefault('ETag', '"%s"' % hashlib.sha1(body).hexdigest())
+        if status == 200 and request_headers.get('If-None-Match') == etag:
+            return 304, {'ETag': etag}, b''
+        return status, headers, body
+
+    def summary(self):
+        return f"Fixtures: {self.hits} served, {self.misses} missing ({len(self)} recorded)"
+
+
+# ===== Session patching =====
+#
+# Every requests session, cloudscraper's included, sends through
+# HTTPAdapter.send, so swapping it covers movie_monitor's AsyncFetcher, the
+# shared scraping sessions and plain requests.get alike. Only GETs are
+# touched; anything else (Twilio, GitHub) goes out untouched.
+
+_original_send = HTTPAdapter.send
+
+def build_response(adapter, request, status, headers, body):
+    raw = HTTPResponse(body=io.BytesIO(body), headers=headers, status=status,
+                       preload_content=False, decode_content=False)
+    return adapter.build_response(request, raw)
+
+def record_to(store):
+    def send(adapter, request, **kwargs):
+        response = _original_send(adapter, request, **kwargs)
+        # A 304 has no body worth replaying
+        if request.method == 'GET' and response.status_code != 304:
+            store.record('GET', request.url, response.status_code, response.headers, response.content)
+        return response
+    HTTPAdapter.send = send
+
+def replay_from(store):
+    def send(adapter, request, **kwargs):
+        if request.method != 'GET':
+            return _original_send(adapter, request, **kwargs)
+        status, headers, body = store.respond('GET', request.url, request.headers)
+        return build_response(adapter, request, status, headers, body)
+    HTTPAdapter.send = send
+
+def forward_to(base_url):
+    # Sends GETs to a FixtureServer instead, so replays go over real sockets
+    def send(adapter, request, **kwargs):
+        if request.method != 'GET' or request.url.startswith(base_url):
+            return _original_send(adapter, request, **kwargs)
+        local = request.copy()
+        local.url = f"{base_url}/{quote(request.url, safe='')}"
+        kwargs['proxies'] = {}
+        response = _original_send(adapter, local, **kwargs)
+        response.url = request.url
+        response.request = request
+        return response
+    HTTPAdapter.send = send
+
+def restore():
+    HTTPAdapter.send = _original_send
+
+
+# ===== Stand-in server =====
+
+class QuietHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients hang up mid-body on purpose (movie_monitor's streaming probe)
+        if not isinstance(sys.exc_info()[1], (ConnectionError, BrokenPipeError)):
+            super().handle_error(request, client_address)
+
+
+class FixtureServer:
+    # Local HTTP server answering "/<quoted original URL>" from a
+    # FixtureStore, with a fixed latency (plus jitter) per request and a
+    # share of requests failing with `error_status`.
+
+    def __init__(self, store, port=0, latency=0.0, jitter=0.0, error_rate=0.0, error_status=503):
+        self.store = store
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.bytes_sent = 0
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                status, headers, body = server.handle(unquote(self.path[1:]), self.headers)
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.httpd = QuietHTTPServer(('127.0.0.1', port), Handler)
+        self.thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def handle(self, url, request_headers):
+        delay = self.latency + random.uniform(0, self.jitter)
+        if delay:
+            time.sleep(delay)
+
+        if self.error_rate and random.random() < self.error_rate:
+            result = (self.error_status, {'Content-Type': 'text/plain'}, b'stand-in server error')
+        else:
+            result = self.store.respond('GET', url, request_headers)
+
+        with self.lock:
+            self.requests += 1
+            self.errors += result[0] == self.error_status
+            self.bytes_sent += len(result[2])
+        return result
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="fixture-server", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def summary(self):
+        return f"Stand-in server: {self.requests} requests, {self.errors} injected errors, {self.bytes_sent / 1024:.0f} KB"
+
+
+def run_script(script, args):
+    sys.argv = [script] + list(args)
+    runpy.run_path(script, run_name='__main__')
+
+
+if __name__ == "__main__":
+    # python fixtures.py record fetch_unified.py
+    # python fixtures.py replay movie_monitor.py
+    # python fixtures.py serve --latency 0.2 --error-rate 0.05 fetch_district.py
+    # Everything after the first *.py argument belongs to that script, so
+    # argv is split there rather than handing argparse a REMAINDER
+    # positional (which swallows options given before the script)
+    argv = sys.argv[1:]
+    split = next((i for i, arg in enumerate(argv) if arg.endswith('.py')), len(argv))
+    script, script_args = (argv[split], argv[split + 1:]) if split < len(argv) else (None, [])
+
+    parser = argparse.ArgumentParser(
+        description="Record scraper traffic into fixtures and replay it offline.",
+        usage="%(prog)s {record,replay,serve,list} [options] [script.py [script args ...]]"
+    )
+    parser.add_argument("mode", choices=["record", "replay", "serve", "list"])
+    parser.add_argument("--dir", default=FIXTURE_DIR, help="fixture store directory")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every served response")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=503)
+    args = parser.parse_args(argv[:split])
+
+    store = FixtureStore(args.dir)
+
+    if args.mode == "list":
+        for url in sorted(store.urls()):
+            print(url)
+        print(f"{len(store)} fixtures in {args.dir}")
+        sys.exit(0)
+
+    if args.mode == "record":
+        record_to(store)
+    elif args.mode == "replay":
+        replay_from(store)
+    else:
+        server = FixtureServer(store, args.port, args.latency, args.jitter, args.error_rate, args.error_status).start()
+        print(f"Serving {len(store)} fixtures on {server.url}")
+        if not script:
+            try:
+                server.thread.join()
+            except KeyboardInterrupt:
+                pass
+            sys.exit(0)
+        forward_to(server.url)
+
+    if script:
+        try:
+            run_script(script, script_args)
+        finally:
+            restore()
+            print(store.summary())
+            if args.mode == "serve":
+                print(server.summary())
+                server.stop()
@@ -0,0 +1,139 @@
+import hashlib
+import json
+import os
+import time
+
+from database import get_db_connection, init_db
+from metrics import metrics
+
+# Bump when a build_city changes its output, so every stored city is rebuilt
+EXPORT_VERSION = 2
+
+
+def city_hash(target, rows):
+    digest = hashlib.sha1(f"{target}:{EXPORT_VERSION}".encode())
+    for row in rows:
+        digest.update(repr(tuple(row)).encode())
+    return digest.hexdigest()
+
+def rows_by_city(cursor, table, cities):
+    # One grouped query per table instead of one per city
+    grouped = {city: [] for city in cities}
+    if not cities:
+        return grouped
+    placeholders = ', '.join('?' * len(cities))
+    cursor.execute(f'SELECT * FROM {table} WHERE city IN ({placeholders}) ORDER BY city, id', cities)
+    for row in cursor:
+        grouped[row['city']].append(row)
+    return grouped
+
+def hashes_path(path):
+    # data/metadata.json -> data/metadata_hashes.json
+    return os.path.splitext(path)[0] + '_hashes.json'
+
+def load_json(path):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def write_json(path, data):
+    with open(path + '.tmp', 'w') as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+def distinct_values(rows, column):
+    # Same as SELECT DISTINCT over the city's movies, in first-seen order
+    seen = {}
+    for row in rows:
+        value = row[column]
+        if value and value != "Unknown":
+            seen.setdefault(value, None)
+    return list(seen)
+
+def export_metadata(path, target, cities, build_city):
+    # Writes {city: build_city(name, movie rows, theatre rows)} to `path`.
+    # Each city's JSON fragment is cached in export_state together with a
+    # hash of its rows; only cities whose rows changed are rebuilt, and the
+    # file is left untouched when nothing changed at all. The output is
+    # byte-identical to json.dump(metadata, f, indent=2).
+    #
+    # The hashes are also written next to `path` (metadata_hashes.json) to
+    # be committed with it: CI starts every run from a fresh database, and
+    # then an unchanged city's fragment is taken from the existing file.
+    init_db()  # export_state comes from a migration
+    started = time.perf_counter()
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    names = [city['name'] for city in cities]
+
+    movies = rows_by_city(cursor, 'movies', names)
+    theatres = rows_by_city(cursor, 'theatres', names)
+
+    cursor.execute('SELECT city, content_hash, fragment FROM export_state WHERE target = ?', (target,))
+    stored = {row['city']: (row['content_hash'], row['fragment']) for row in cursor.fetchall()}
+    committed = load_json(hashes_path(path))
+    existing = None     # the current file, parsed only if a city needs it
+
+    fragments = []
+    hashes = {}
+    rebuilt = 0
+    for name in names:
+        content_hash = hashes[name] = city_hash(target, movies[name] + theatres[name])
+        previous = stored.pop(name, None)
+        if previous is None and committed.get(name) == content_hash:
+            if existing is None:
+                existing = load_json(path)
+            if name in existing:
+                previous = (content_hash, json.dumps(existing[name], indent=2).replace('\n', '\n  '))
+                cursor.execute('''
+                    INSERT INTO export_state (target, city, content_hash, fragment)
+                    VALUES (?, ?, ?, ?)
+                ''', (target, name, *previous))
+        if previous and previous[0] == content_hash:
+            fragment = previous[1]
+        else:
+            city_data = build_city(name, movies[name], theatres[name])
+            fragment = json.dumps(city_data, indent=2).replace('\n', '\n  ')
+            cursor.execute('''
+                INSERT INTO export_state (target, city, content_hash, fragment)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(target, city) DO UPDATE SET
+                    content_hash = excluded.content_hash,
+                    fragment = excluded.fragment
+            ''', (target, name, content_hash, fragment))
+            rebuilt += 1
+        fragments.append((name, fragment))
+
+    # Cities dropped from cities.json
+    removed = len(set(stored) | (set(committed) - set(names)))
+    cursor.executemany('DELETE FROM export_state WHERE target = ? AND city = ?',
+                       [(target, name) for name in stored])
+    conn.commit()
+    conn.close()
+    metrics.observe('db_write_seconds', time.perf_counter() - started, stage='export')
+    metrics.record_rows('export_state', rebuilt + removed)
+
+    if committed != hashes:
+        write_json(hashes_path(path), hashes)
+
+    if not rebuilt and not removed and os.path.exists(path):
+        print(f"{path} is up to date ({len(names)} cities unchanged)")
+        return False
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        if not fragments:
+            f.write('{}')
+        else:
+            f.write('{\n')
+            for i, (name, fragment) in enumerate(fragments):
+                if i:
+                    f.write(',\n')
+                f.write(f'  {json.dumps(name)}: {fragment}')
+            f.write('\n}')
+    os.replace(tmp_path, path)
+
+    print(f"Regenerated {rebuilt} of {len(names)} cities in {path}")
+    return True
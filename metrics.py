@@ -0,0 +1,201 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+from profiling import working_on
+
+DATA_DIR = 'data'
+PREFIX = 'movienotify_'
+
+# Upper bounds in seconds; fetches and DB writes both fit this range
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+HELP = {
+    'fetch_seconds': 'HTTP fetch latency per host',
+    'http_responses_total': 'HTTP responses per host and status code',
+    'parse_seconds': 'Time spent parsing pages per stage',
+    'db_write_seconds': 'Time spent in database writes per stage',
+    'rows_written_total': 'Rows inserted or updated per table',
+    'notifications_total': 'WhatsApp notifications per result',
+    'notification_retries_total': 'WhatsApp sends retried after a transient error',
+    'alert_syncs_total': 'alerts.json syncs per source and outcome',
+    'run_seconds': 'Wall time of the last run',
+    'run_timestamp_seconds': 'Unix time the last run finished',
+}
+
+
+class Histogram:
+    __slots__ = ('counts', 'count', 'sum')
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            total += count
+            yield bound, total
+
+    def quantile(self, q):
+        # Upper bound of the bucket holding the q-th observation, None when
+        # it lies past the last bucket (JSON has no infinity)
+        target = q * self.count
+        for bound, total in self.cumulative():
+            if total >= target:
+                return bound
+        return None
+
+
+class Registry:
+    # Counters, gauges and histograms for one run, keyed by name + labels.
+    # Thread-safe; write() dumps them as JSON and Prometheus text format.
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.started = time.monotonic()
+
+    @staticmethod
+    def key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name, amount=1, **labels):
+        key = self.key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def set(self, name, value, **labels):
+        with self.lock:
+            self.gauges[self.key(name, labels)] = value
+
+    def observe(self, name, value, **labels):
+        key = self.key(name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def record_response(self, url, response, seconds):
+        host = urlsplit(url).hostname or 'unknown'
+        self.observe('fetch_seconds', seconds, host=host)
+        self.inc('http_responses_total', host=host, status=str(response.status_code))
+
+    def record_error(self, url):
+        host = urlsplit(url).hostname or 'unknown'
+        self.inc('http_responses_total', host=host, status='error')
+
+    def record_rows(self, table, count):
+        # cursor.rowcount is -1 for statements that don't modify rows
+        if count and count > 0:
+            self.inc('rows_written_total', count, table=table)
+
+    def summary(self):
+        with self.lock:
+            return {
+                "counters": [
+                    {"name": name, "labels": dict(labels), "value": value}
+                    for (name, labels), value in sorted(self.counters.items())
+                ],
+                "gauges": [
+                    {"name": name, "labels": dict(labels), "value": value}
+                    for (name, labels), value in sorted(self.gauges.items())
+                ],
+                "histograms": [
+                    {
+                        "name": name, "labels": dict(labels),
+                        "count": h.count, "sum": round(h.sum, 6),
+                        "p50": h.quantile(0.5), "p95": h.quantile(0.95), "p99": h.quantile(0.99)
+                    }
+                    for (name, labels), h in sorted(self.histograms.items())
+                ],
+            }
+
+    def prometheus(self):
+        lines = []
+        described = set()
+
+        def describe(name, kind):
+            if name not in described:
+                described.add(name)
+                lines.append(f"# HELP {PREFIX}{name} {HELP.get(name, name)}")
+                lines.append(f"# TYPE {PREFIX}{name} {kind}")
+
+        def label_text(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ''
+            return '{' + ','.join(f'{k}="{v}"' for k, v in pairs) + '}'
+
+        with self.lock:
+            for (name, labels), value in sorted(self.counters.items()):
+                describe(name, 'counter')
+                lines.append(f"{PREFIX}{name}{label_text(labels)} {value}")
+            for (name, labels), value in sorted(self.gauges.items()):
+                describe(name, 'gauge')
+                lines.append(f"{PREFIX}{name}{label_text(labels)} {value}")
+            for (name, labels), h in sorted(self.histograms.items()):
+                describe(name, 'histogram')
+                for bound, total in h.cumulative():
+                    lines.append(f"{PREFIX}{name}_bucket{label_text(labels, [('le', bound)])} {total}")
+                lines.append(f"{PREFIX}{name}_bucket{label_text(labels, [('le', '+Inf')])} {h.count}")
+                lines.append(f"{PREFIX}{name}_sum{label_text(labels)} {h.sum:.6f}")
+                lines.append(f"{PREFIX}{name}_count{label_text(labels)} {h.count}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, job, directory=DATA_DIR):
+        # data/metrics_<job>.json and data/metrics_<job>.prom (node_exporter
+        # textfile collector format), both replaced atomically
+        elapsed = time.monotonic() - self.started
+        self.set('run_seconds', round(elapsed, 3), job=job)
+        self.set('run_timestamp_seconds', int(time.time()), job=job)
+
+        os.makedirs(directory, exist_ok=True)
+        base = os.path.join(directory, f"metrics_{job}")
+        summary = dict(self.summary(), job=job, elapsed_seconds=round(elapsed, 3))
+        for path, content in ((base + '.json', json.dumps(summary, indent=2)), (base + '.prom', self.prometheus())):
+            with open(path + '.tmp', 'w') as f:
+                f.write(content)
+            os.replace(path + '.tmp', path)
+
+        print(f"Run metrics: {elapsed:.1f}s, written to {base}.json / .prom")
+        return summary
+
+
+# One registry per process
+metrics = Registry()
+
+def timed_get(get, url, **kwargs):
+    # get(url, **kwargs) with its latency and status (or failure) recorded
+    started = time.perf_counter()
+    try:
+        with working_on(url):
+            response = get(url, **kwargs)
+    except Exception:
+        metrics.record_error(url)
+        raise
+    metrics.record_response(url, response, time.perf_counter() - started)
+    return response
@@ -0,0 +1,176 @@
+import asyncio
+import heapq
+import json
+import os
+import signal
+import time
+
+import movie_monitor
+from async_fetch import AsyncFetcher
+from database import get_db_connection, init_db
+from metrics import metrics
+from notifier import get_dispatcher
+from page_cache import PageCache
+from ratelimit import TokenBucket
+
+ALERTS_FILE = "alerts.json"
+METADATA_FILE = os.path.join('data', 'metadata.json')
+
+# Seconds between two checks of the same movie URL
+COMING_SOON_INTERVAL = 60
+DEFAULT_INTERVAL = 300
+MAX_INTERVAL = 1800
+# Each check that finds nothing new stretches the interval by this factor
+BACKOFF_FACTOR = 1.5
+
+# How often alerts.json / metadata.json are looked at for changes
+RELOAD_INTERVAL = 30
+
+DEFAULT_REQUESTS_PER_MINUTE = 60
+
+
+def event_code(url):
+    # ".../movies/chennai/some-movie/ET00423419" -> "ET00423419"
+    return url.rstrip('/').split('/')[-1]
+
+def file_mtime(path):
+    return os.path.getmtime(path) if os.path.exists(path) else None
+
+def load_statuses():
+    # {event code: NOW_SHOWING | COMING_SOON} from the exported metadata
+    try:
+        with open(METADATA_FILE, 'r') as f:
+            metadata = json.load(f)
+    except Exception as e:
+        print(f"Error reading {METADATA_FILE}: {e}")
+        return {}
+
+    statuses = {}
+    for city in metadata.values():
+        for movie in city.get("movies", []):
+            code = event_code(movie.get("url", ""))
+            # A title listed as coming soon anywhere keeps the fast lane
+            if statuses.get(code) != "COMING_SOON":
+                statuses[code] = movie.get("status")
+    return statuses
+
+
+class PollScheduler:
+    # Min-heap of (due time, movie URL). Coming-soon titles start on the
+    # short interval, pages that keep coming back unchanged back off
+    # towards MAX_INTERVAL, and any change snaps them back to their base.
+
+    def __init__(self, statuses=None):
+        self.statuses = statuses or {}
+        self.heap = []
+        self.due = {}
+        self.intervals = {}
+
+    def base_interval(self, url):
+        if self.statuses.get(event_code(url)) == "COMING_SOON":
+            return COMING_SOON_INTERVAL
+        return DEFAULT_INTERVAL
+
+    def push(self, url, due):
+        self.due[url] = due
+        heapq.heappush(self.heap, (due, url))
+
+    def sync(self, urls, now):
+        # New URLs are checked right away, removed ones are dropped
+        for url in urls:
+            if url not in self.due:
+                self.intervals[url] = self.base_interval(url)
+                self.push(url, now)
+        for url in list(self.due):
+            if url not in urls:
+                del self.due[url]
+                del self.intervals[url]
+
+    def _drop_stale(self):
+        # Entries superseded by a later push or belonging to removed URLs
+        while self.heap and self.due.get(self.heap[0][1]) != self.heap[0][0]:
+            heapq.heappop(self.heap)
+
+    def pop_due(self, now):
+        urls = []
+        self._drop_stale()
+        while self.heap and self.heap[0][0] <= now:
+            urls.append(heapq.heappop(self.heap)[1])
+            self._drop_stale()
+        return urls
+
+    def reschedule(self, url, changed, now):
+        if url not in self.due:
+            return
+        if changed:
+            interval = self.base_interval(url)
+        else:
+            interval = min(MAX_INTERVAL, self.intervals[url] * BACKOFF_FACTOR)
+        self.intervals[url] = interval
+        self.push(url, now + interval)
+
+    def next_due(self):
+        self._drop_stale()
+        return self.heap[0][0] if self.heap else None
+
+
+async def run_daemon(requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE):
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+
+    init_db()
+    conn = get_db_connection()
+    scheduler = PollScheduler()
+    cache = PageCache()
+    budget = TokenBucket.per_minute(requests_per_minute)
+    alerts = []
+    versions = None
+    last_reload = None
+
+    print(f"Ticket daemon started, budget {requests_per_minute} requests/minute.")
+
+    with AsyncFetcher(headers=movie_monitor.HEADERS, budget=budget) as fetcher:
+        while not stop.is_set():
+            now = time.monotonic()
+            if last_reload is None or now - last_reload >= RELOAD_INTERVAL:
+                last_reload = now
+                current = (file_mtime(ALERTS_FILE), file_mtime(METADATA_FILE))
+                if current != versions:
+                    versions = current
+                    alerts = movie_monitor.get_alerts()
+                    scheduler.statuses = load_statuses()
+                    scheduler.sync({a["url"] for a in alerts if a.get("url")}, now)
+                    print(f"Loaded {len(alerts)} alerts for {len(scheduler.due)} URLs.")
+
+            due_urls = scheduler.pop_due(now)
+            if due_urls:
+                wanted = set(due_urls)
+                batch = [a for a in alerts if a.get("url") in wanted]
+                try:
+                    changed = await movie_monitor.run_checks(batch, fetcher, cache, conn)
+                except Exception as e:
+                    print(f"Error in check batch: {e}")
+                    changed = {}
+                cache.flush()
+
+                now = time.monotonic()
+                for url in due_urls:
+                    scheduler.reschedule(url, changed.get(url, False), now)
+                continue
+
+            # Sleep until the next URL is due, a reload is due, or SIGTERM
+            next_due = scheduler.next_due()
+            timeout = RELOAD_INTERVAL if next_due is None else min(RELOAD_INTERVAL, max(0, next_due - now))
+            try:
+                await asyncio.wait_for(stop.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    cache.close()
+    conn.close()
+    print(cache.summary())
+    print(get_dispatcher().summary())
+    metrics.write('daemon')
+    print("Ticket daemon stopped.")
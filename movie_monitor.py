@@ -1,155 +1,422 @@
-import os
-import requests
 from bs4 import BeautifulSoup
-import sys
-import json
-from twilio.rest import Client
-
-def send_whatsapp_message(to_number, message):
-    account_sid = os.environ.get("TWILIO_ACCOUNT_SID")
-    auth_token = os.environ.get("TWILIO_AUTH_TOKEN")
-    from_whatsapp = os.environ.get("TWILIO_FROM_WHATSAPP") # e.g., "whatsapp:+14155238886"
-    
-    # Use the number from the alert if present, otherwise fallback to env var (for legacy/testing)
-    to_whatsapp = to_number if to_number else os.environ.get("TWILIO_TO_WHATSAPP")
-    
-    if not account_sid or not auth_token:
-        print("Error: TWILIO_ACCOUNT_SID or TWILIO_AUTH_TOKEN not set.")
-        return
+import argparse
+import time
+import asyncio
+import codecs
+import hashlib
+from html.parser import HTMLParser
+from alert_store import FILE_SOURCE, sync_from_file, load_alerts
+from async_fetch import AsyncFetcher
+from database import get_db_connection, init_db, alert_key, match_hash, should_notify, record_notification
+from metrics import metrics
+from notifier import DigestBatch, get_dispatcher
+from profiling import add_arguments as add_profile_arguments, profiled, working_on
+from page_cache import PageCache
+from showtimes import ShowtimeIndex, compile_time_filters
+from text_matcher import PatternMatcher
+
+# Movie pages are streamed in chunks of this size and abandoned as soon as
+# the probe has what it needs
+PROBE_CHUNK_SIZE = 16 * 1024
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.114 Safari/537.36"
+}
 
-    try:
-        client = Client(account_sid, auth_token)
-        message = client.messages.create(
-            body=message,
-            from_=from_whatsapp,
-            to=to_whatsapp
-        )
-        print(f"Notification sent successfully to {to_whatsapp}! SID: {message.sid}")
-    except Exception as e:
-        print(f"Failed to send notification: {e}")
+ALERTS_FILE = "alerts.json"
 
 def get_alerts():
-    # Read from alerts.json
-    try:
-        with open("alerts.json", "r") as f:
-            return json.load(f)
-    except Exception as e:
-        print(f"Error reading alerts.json: {e}")
-        return []
+    # Alerts with a URL to check, from the local alert store after syncing
+    # it with alerts.json (skipped while the file is unchanged)
+    sync_from_file(ALERTS_FILE, FILE_SOURCE)
+    return load_alerts(FILE_SOURCE, with_url=True)
 
-def check_tickets():
-    alerts = get_alerts()
-    if not alerts:
-        print("No alerts found in alerts.json.")
-        return
+def filters_match(movie_name, text_filters, time_mask, matched_text, showtimes):
+    # 1. Check Text Filters (IMAX, PVR) against the patterns found on the page
+    matches_text = False
+    if text_filters:
+        found = [f for f in text_filters if f.lower() in matched_text]
+        if found:
+            matches_text = True
+            print(f"    [{movie_name}] Matched text filters: {found}")
+    else:
+        matches_text = True # No text filters = pass
 
-    print(f"Checking {len(alerts)} alerts...")
-    
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.114 Safari/537.36"
+    # 2. Check Time Filters (Morning, Evening) against the page's show index
+    matches_time = False
+    if time_mask is not None:
+        matches_time = showtimes.matches(time_mask)
+        if matches_time:
+            print(f"    [{movie_name}] Matched time filters.")
+    else:
+        matches_time = True # No time filters = pass
+
+    return matches_text and matches_time
+
+def queue_notification(digest, conn, alert, url, matched, message):
+    # Alerts are only re-sent when what they matched changed or the
+    # cooldown ran out. Returns the delivery tag when the match counts as
+    # delivered already, None when it was queued.
+    key, match_digest = alert_key(alert), match_hash(matched)
+    tag = (url, key, match_digest, message)
+    if not should_notify(conn, key, match_digest):
+        print(f"  [{alert.get('name', 'Unknown Movie')}] Already notified, skipping.")
+        return tag
+    digest.add(alert.get("phone"), message, tag=tag)
+    return None
+
+async def send_notifications(digest, conn):
+    # One digest per phone; its alerts count as notified once every part
+    # of it was delivered. Returns the tags of the delivered ones.
+    matches = len(digest)
+    batches = digest.send(get_dispatcher())
+    if batches:
+        print(f"Sending {matches} match(es) as {len(batches)} digest(s).")
+    delivered = []
+    for tags, futures in batches:
+        results = await asyncio.gather(*(asyncio.wrap_future(f) for f in futures))
+        if all(results):
+            for tag in tags:
+                _, key, match_digest, _ = tag
+                record_notification(conn, key, match_digest)
+                delivered.append(tag)
+    return delivered
+
+def split_filters(filters):
+    # TIME filters compile to a bucket bitmask, None when the alert has none
+    time_filters = [f.split(':')[1] for f in filters if f.startswith('TIME:')]
+    text_filters = [f for f in filters if not f.startswith('TIME:')]
+    return text_filters, compile_time_filters(time_filters) if time_filters else None
+
+def absolute_booking_link(href):
+    if not href.startswith('http'):
+        href = "https://in.bookmyshow.com" + href
+    return href
+
+def parse_movie_page(html):
+    soup = BeautifulSoup(html, 'html.parser')
+    page_text = soup.get_text().lower()
+
+    page = {"open": "book tickets" in page_text, "booking_link": None, "link_checked": True}
+    if not page["open"]:
+        return page
+
+    # Find booking link
+    for a in soup.find_all('a', href=True):
+        if "book tickets" in a.get_text().lower():
+            page["booking_link"] = absolute_booking_link(a['href'])
+            break
+    return page
+
+class BookingProbe(HTMLParser):
+    # Incremental version of parse_movie_page: looks for the "book tickets"
+    # text and the first <a href> whose text contains it, chunk by chunk.
+
+    MARKER = "book tickets"
+    # Text bs4's get_text() leaves out, so the probe mustn't see it either
+    # (BMS pages carry "Book tickets" inside JSON <script> blobs)
+    HIDDEN_TAGS = {'script', 'style', 'template'}
+
+    def __init__(self):
+        super().__init__()
+        self.hidden = 0
+        self.found_marker = False
+        self.booking_link = None
+        self.tail = ""
+        self.anchor_href = None
+        self.anchor_text = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.HIDDEN_TAGS:
+            self.hidden += 1
+        elif tag == 'a':
+            self.anchor_href = dict(attrs).get('href')
+            self.anchor_text = []
+
+    def handle_endtag(self, tag):
+        if tag in self.HIDDEN_TAGS:
+            self.hidden = max(0, self.hidden - 1)
+            return
+        if tag != 'a' or self.anchor_href is None:
+            return
+        if self.booking_link is None and self.MARKER in "".join(self.anchor_text).lower():
+            self.booking_link = self.anchor_href
+        self.anchor_href = None
+
+    def handle_data(self, data):
+        if self.hidden:
+            return
+        if self.anchor_href is not None:
+            self.anchor_text.append(data)
+        if not self.found_marker:
+            # Text can be split across tags and chunks, keep enough of the tail
+            window = (self.tail + data).lower()
+            self.found_marker = self.MARKER in window
+            self.tail = window[-(len(self.MARKER) - 1):]
+
+def probe_movie_page(response, need_link):
+    # Runs on the fetch thread while the body is still streaming in
+    if response.status_code == 304:
+        return None
+    response.raise_for_status()
+
+    probe = BookingProbe()
+    digest = hashlib.sha256()
+    chunks = []
+    complete = True
+    decoder = codecs.getincrementaldecoder(response.encoding or 'utf-8')(errors='replace')
+
+    for chunk in response.iter_content(PROBE_CHUNK_SIZE):
+        digest.update(chunk)
+        chunks.append(chunk)
+        probe.feed(decoder.decode(chunk))
+        if probe.found_marker and (probe.booking_link or not need_link):
+            complete = False
+            break
+
+    page = {
+        "open": probe.found_marker,
+        "booking_link": absolute_booking_link(probe.booking_link) if probe.booking_link else None,
+        "link_checked": complete or probe.booking_link is not None
+    }
+
+    if complete and page["open"] and not page["booking_link"] and need_link:
+        # Marker is there but the anchor didn't look like we expected
+        page = parse_movie_page(b"".join(chunks).decode(response.encoding or 'utf-8', errors='replace'))
+
+    return {
+        "page": page,
+        "digest": digest.hexdigest(),
+        "bytes_read": sum(len(c) for c in chunks)
     }
 
+async def conditional_get(fetcher, cache, url):
+    response = await fetcher.get(url, headers=cache.conditional_headers(url))
+    if response.status_code != 304:
+        response.raise_for_status()
+    return response, cache.revalidate(url, response)
+
+async def fetch_movie_page(fetcher, cache, movie_url, need_link):
+    consume = lambda response: probe_movie_page(response, need_link)
+    response, probe = await fetcher.stream(movie_url, consume, headers=cache.conditional_headers(movie_url))
+    cached = cache.revalidate(movie_url, response, digest=probe and probe["digest"])
+
+    meta = cache.meta(cached) if cached is not None else None
+    if meta is not None and (meta.get("link_checked") or not need_link):
+        return dict(meta, unchanged=True, bytes_read=probe["bytes_read"] if probe else 0)
+
+    if probe is None:
+        # 304, but the cached result lacks the booking link we now need
+        response, probe = await fetcher.stream(movie_url, consume)
+
+    cache.store(movie_url, response, meta=probe["page"], digest=probe["digest"])
+    return dict(probe["page"], unchanged=cached is not None, bytes_read=probe["bytes_read"])
+
+async def fetch_booking_page(fetcher, cache, booking_link):
+    # Parsing (and decompressing a cached body) is deferred until we know
+    # some alert still needs this page
+    booking_response, cached = await conditional_get(fetcher, cache, booking_link)
+    if cached is not None and cached['body'] is not None:
+        return {"unchanged": True, "html": None, "cached": cached}
+
+    if booking_response.status_code == 304:
+        booking_response = await fetcher.get(booking_link)
+        booking_response.raise_for_status()
+
+    cache.store(booking_link, booking_response, body=booking_response.content)
+    return {"unchanged": False, "html": booking_response.text}
+
+async def fetch_all(fetch, urls):
+    # One request per unique URL; failures are returned, not raised
+    results = await asyncio.gather(*(fetch(url) for url in urls), return_exceptions=True)
+    return dict(zip(urls, results))
+
+def pending_alerts(cache, conn, digest, url, alerts, unchanged):
+    # On an unchanged page only alerts added since the last run need a look.
+    # A match delivered earlier is re-sent from the cache once its cooldown
+    # ran out, without parsing the page again.
+    if not unchanged:
+        return alerts
+
+    evaluated = cache.evaluated(url)
+    pending = []
     for alert in alerts:
-        movie_url = alert.get("url")
-        movie_name = alert.get("name", "Unknown Movie")
-        phone = alert.get("phone") 
-        filters = alert.get("filters", []) 
-        
-        if not movie_url:
+        key = alert_key(alert)
+        if key not in evaluated:
+            pending.append(alert)
+            continue
+        movie_name = alert.get('name', 'Unknown Movie')
+        delivered = evaluated[key]
+        if delivered and should_notify(conn, key, delivered[0]):
+            print(f"  [{movie_name}] Unchanged, cooldown over, sending again.")
+            digest.add(alert.get("phone"), delivered[1], tag=(url, key, delivered[0], delivered[1]))
+        else:
+            print(f"  [{movie_name}] Unchanged since last check.")
+    return pending
+
+async def run_checks(alerts, fetcher, cache, conn):
+    # Checks one batch of alerts and returns {movie_url: changed}, where
+    # changed is False when neither the movie nor its booking page moved.
+    # Group alerts by movie URL so every page is downloaded and parsed once
+    by_url = {}
+    for alert in alerts:
+        if alert.get("url"):
+            by_url.setdefault(alert["url"], []).append(alert)
+
+    notifications = DigestBatch()
+    # Alerts that didn't match, per page, and the tags of matches that
+    # count as delivered. Both are marked evaluated only after the sends,
+    # so a failed send leaves its alert pending and is retried.
+    unmatched = {}
+    delivered = []
+    by_booking_link = {}
+    requested = 0
+
+    need_link = {url: any(a.get("filters") for a in url_alerts) for url, url_alerts in by_url.items()}
+    movie_pages = await fetch_all(lambda url: fetch_movie_page(fetcher, cache, url, need_link[url]), list(by_url))
+    probe_bytes = sum(p["bytes_read"] for p in movie_pages.values() if not isinstance(p, Exception))
+
+    for movie_url, url_alerts in by_url.items():
+        requested += len(url_alerts)
+        page = movie_pages[movie_url]
+
+        if isinstance(page, Exception):
+            for alert in url_alerts:
+                print(f"Error checking {alert.get('name', 'Unknown Movie')}: {page}")
+            continue
+
+        # Filtered alerts always go on to the booking page, which has its own cache entry
+        filtered = [a for a in url_alerts if a.get("filters")]
+        unfiltered = pending_alerts(cache, conn, notifications, movie_url,
+                                    [a for a in url_alerts if not a.get("filters")], page["unchanged"])
+
+        for alert in unfiltered + filtered:
+            movie_name = alert.get("name", "Unknown Movie")
+            print(f"Checking: {movie_name}")
+
+            if not page["open"]:
+                print(f"  [{movie_name}] Not open yet.")
+                if not alert.get("filters"):
+                    unmatched.setdefault(movie_url, []).append(alert)
+                continue
+
+            print(f"  [{movie_name}] 'Book Tickets' found.")
+
+            # If no filters, notify
+            if not alert.get("filters"):
+                tag = queue_notification(notifications, conn, alert, movie_url, [movie_url],
+                                         f"🎟️ Tickets available for *{movie_name}*! \n\nBook: {movie_url}")
+                if tag:
+                    delivered.append(tag)
+                continue
+
+            if not page["booking_link"]:
+                print(f"  [{movie_name}] Could not find booking link.")
+                continue
+
+            by_booking_link.setdefault(page["booking_link"], []).append(alert)
+
+    for booking_link, link_alerts in by_booking_link.items():
+        requested += len(link_alerts)
+        print(f"  Checking showtimes for {len(link_alerts)} alert(s): {booking_link}")
+
+    booking_pages = await fetch_all(lambda url: fetch_booking_page(fetcher, cache, url), list(by_booking_link))
+
+    # Every text filter of every alert, scanned for in one pass per page
+    text_matcher = PatternMatcher(
+        f for link_alerts in by_booking_link.values() for alert in link_alerts
+        for f in split_filters(alert.get("filters", []))[0]
+    )
+
+    for booking_link, link_alerts in by_booking_link.items():
+        booking = booking_pages[booking_link]
+
+        if isinstance(booking, Exception):
+            for alert in link_alerts:
+                print(f"  [{alert.get('name', 'Unknown Movie')}] Error checking booking page: {booking}")
             continue
 
-        print(f"Checking: {movie_name}")
-        
-        # Separate filters
-        time_filters = [f.split(':')[1] for f in filters if f.startswith('TIME:')]
-        text_filters = [f for f in filters if not f.startswith('TIME:')]
-
-        try:
-            response = requests.get(movie_url, headers=headers)
-            response.raise_for_status()
-            soup = BeautifulSoup(response.text, 'html.parser')
-            page_text = soup.get_text().lower()
-            
-            if "book tickets" in page_text:
-                print(f"  'Book Tickets' found.")
-                
-                # If no filters, notify
-                if not filters:
-                    send_whatsapp_message(phone, f"🎟️ Tickets available for *{movie_name}*! \n\nBook: {movie_url}")
-                    continue
-
-                # Find booking link
-                booking_link = None
-                for a in soup.find_all('a', href=True):
-                    if "book tickets" in a.get_text().lower():
-                        booking_link = a['href']
-                        break
-                
-                if booking_link:
-                    if not booking_link.startswith('http'):
-                        booking_link = "https://in.bookmyshow.com" + booking_link
-                        
-                    print(f"  Checking showtimes: {booking_link}")
-                    try:
-                        booking_response = requests.get(booking_link, headers=headers)
-                        booking_soup = BeautifulSoup(booking_response.text, 'html.parser')
-                        booking_text = booking_soup.get_text().lower()
-                        
-                        # 1. Check Text Filters (IMAX, PVR)
-                        matches_text = False
-                        if text_filters:
-                            found = [f for f in text_filters if f.lower() in booking_text]
-                            if found:
-                                matches_text = True
-                                print(f"    Matched text filters: {found}")
-                        else:
-                            matches_text = True # No text filters = pass
-
-                        # 2. Check Time Filters (Morning, Evening)
-                        matches_time = False
-                        if time_filters:
-                            # Heuristic: Look for time strings like "10:00 AM", "06:30 PM"
-                            # This is tricky without a proper parser, but we can scan the text
-                            # for times and categorize them.
-                            import re
-                            times_found = re.findall(r'(\d{1,2}):(\d{2})\s?(AM|PM)', booking_response.text, re.IGNORECASE)
-                            
-                            for h, m, p in times_found:
-                                hour = int(h)
-                                period = p.upper()
-                                if period == 'PM' and hour != 12: hour += 12
-                                if period == 'AM' and hour == 12: hour = 0
-                                
-                                # Categories
-                                is_morning = 5 <= hour < 12
-                                is_afternoon = 12 <= hour < 16
-                                is_evening = 16 <= hour < 20
-                                is_night = hour >= 20 or hour < 5
-                                
-                                if 'MORNING' in time_filters and is_morning: matches_time = True
-                                if 'AFTERNOON' in time_filters and is_afternoon: matches_time = True
-                                if 'EVENING' in time_filters and is_evening: matches_time = True
-                                if 'NIGHT' in time_filters and is_night: matches_time = True
-                                
-                            if matches_time:
-                                print(f"    Matched time filters.")
-                        else:
-                            matches_time = True # No time filters = pass
-
-                        if matches_text and matches_time:
-                            send_whatsapp_message(phone, f"🎟️ Tickets found for *{movie_name}*! \n\nFilters Matched! \nBook: {booking_link}")
-                        else:
-                            print("    Filters did not match.")
-
-                    except Exception as e:
-                        print(f"  Error checking booking page: {e}")
-                else:
-                    print("  Could not find booking link.")
+        link_alerts = pending_alerts(cache, conn, notifications, booking_link, link_alerts, booking["unchanged"])
+        if not link_alerts:
+            continue
+
+        html = booking["html"] if booking["html"] is not None else cache.body(booking["cached"])
+        with metrics.timer('parse_seconds', stage='booking'), working_on(booking_link):
+            booking_soup = BeautifulSoup(html, 'html.parser')
+            matched_text = text_matcher.scan(booking_soup.get_text().lower())
+            booking_shows = ShowtimeIndex.from_html(html)
+
+        for alert in link_alerts:
+            movie_name = alert.get("name", "Unknown Movie")
+            text_filters, time_mask = split_filters(alert.get("filters", []))
+            if filters_match(movie_name, text_filters, time_mask, matched_text, booking_shows):
+                matched = [booking_link] + [f.lower() for f in text_filters if f.lower() in matched_text]
+                if time_mask is not None:
+                    matched += booking_shows.shows_matching(time_mask)
+                tag = queue_notification(notifications, conn, alert, booking_link, matched,
+                                         f"🎟️ Tickets found for *{movie_name}*! \n\nFilters Matched! \nBook: {booking_link}")
+                if tag:
+                    delivered.append(tag)
             else:
-                print(f"  Not open yet.")
+                print(f"    [{movie_name}] Filters did not match.")
+                unmatched.setdefault(booking_link, []).append(alert)
 
-        except Exception as e:
-            print(f"Error checking {movie_name}: {e}")
+    delivered += await send_notifications(notifications, conn)
+
+    # Only now, so nothing is skipped on an unchanged page before it was sent
+    for url, url_alerts in unmatched.items():
+        cache.mark_evaluated(url, url_alerts)
+    for url, key, match_digest, message in delivered:
+        cache.mark_delivered(url, key, match_digest, message)
+
+    fetched = len(by_url) + len(by_booking_link)
+    if fetched:
+        print(f"Fetched {fetched} pages for {requested} page checks (dedup ratio {requested / fetched:.1f}x)")
+        print(f"Movie page probes read {probe_bytes / 1024:.0f} KB")
+
+    changed = {url: not isinstance(page, Exception) and not page["unchanged"] for url, page in movie_pages.items()}
+    for booking_link, link_alerts in by_booking_link.items():
+        booking = booking_pages[booking_link]
+        if not isinstance(booking, Exception) and not booking["unchanged"]:
+            for alert in link_alerts:
+                changed[alert["url"]] = True
+    return changed
+
+async def check_tickets_async(alerts):
+    conn = get_db_connection()
+    cache = PageCache()
+    with AsyncFetcher(headers=HEADERS) as fetcher:
+        await run_checks(alerts, fetcher, cache, conn)
+    cache.close()
+    conn.close()
+    print(cache.summary())
+    print(get_dispatcher().summary())
+
+def check_tickets():
+    init_db()
+    alerts = get_alerts()
+    if not alerts:
+        print("No alerts found in alerts.json.")
+        return
+
+    print(f"Checking {len(alerts)} alerts...")
+
+    started = time.monotonic()
+    asyncio.run(check_tickets_async(alerts))
+    print(f"Checked {len(alerts)} alerts in {time.monotonic() - started:.1f}s")
 
 if __name__ == "__main__":
-    check_tickets()
+    parser = argparse.ArgumentParser(description="Check alerts.json for open bookings.")
+    parser.add_argument("--daemon", action="store_true", help="keep running and poll on an adaptive schedule")
+    parser.add_argument("--requests-per-minute", type=int, default=None, help="global request budget in daemon mode")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    if args.daemon:
+        from monitor_daemon import run_daemon, DEFAULT_REQUESTS_PER_MINUTE
+        with profiled('daemon', args):
+            asyncio.run(run_daemon(args.requests_per_minute or DEFAULT_REQUESTS_PER_MINUTE))
+    else:
+        with profiled('monitor', args):
+            check_tickets()
+        metrics.write('monitor')
@@ -0,0 +1,159 @@
+import datetime
+import html
+import json
+import re
+from zoneinfo import ZoneInfo
+
+from showtimes import TIME_PATTERN, to_minutes, format_time
+
+# orjson is several times faster on large payloads, json is the fallback
+try:
+    import orjson
+    loads = orjson.loads
+except ImportError:
+    loads = json.loads
+
+NEXT_DATA_MARKER = b'id="__NEXT_DATA__"'
+TITLE_PATTERN = re.compile(rb'<title[^>]*>(.*?)</title>', re.IGNORECASE | re.DOTALL)
+
+# Key names the showtime walker recognises in the page's JSON
+VENUE_KEYS = ('cinemaName', 'theatreName', 'venueName', 'cinema_name', 'theatre_name', 'venue_name')
+VENUE_OBJECT_KEYS = ('cinema', 'theatre', 'venue')
+SESSION_KEYS = ('sessions', 'showtimes', 'showTimes', 'shows', 'sessionList')
+TIME_KEYS = ('showTime', 'sessionTime', 'startTime', 'showtime', 'start_time', 'time')
+DATE_KEYS = ('showDate', 'sessionDate', 'show_date', 'date')
+FORMAT_KEYS = ('format', 'screenFormat', 'experience', 'dimension')
+LANGUAGE_KEYS = ('language', 'lang')
+
+# Showtimes are stored in the theatres' local time
+LOCAL_TZ = ZoneInfo('Asia/Kolkata')
+
+
+def slice_next_data(body):
+    # Bytes of the __NEXT_DATA__ <script> payload, found by scanning for
+    # the tag instead of parsing the page. None if the page has none.
+    marker = body.find(NEXT_DATA_MARKER)
+    if marker == -1:
+        return None
+    start = body.find(b'>', marker) + 1
+    end = body.find(b'</script>', start)
+    if start == 0 or end == -1:
+        return None
+    return body[start:end]
+
+def page_title(body):
+    match = TITLE_PATTERN.search(body)
+    if not match:
+        return None
+    return html.unescape(match.group(1).decode('utf-8', 'replace')).strip()
+
+def first_string(node, keys):
+    for key in keys:
+        value = node.get(key)
+        if isinstance(value, str) and value.strip():
+            return value.strip()
+    return None
+
+def venue_name(node):
+    name = first_string(node, VENUE_KEYS)
+    if name:
+        return name
+    for key in VENUE_OBJECT_KEYS:
+        value = node.get(key)
+        if isinstance(value, dict):
+            name = first_string(value, ('name',) + VENUE_KEYS)
+            if name:
+                return name
+    # A bare "name" only counts when the object lists sessions under it
+    if any(isinstance(node.get(key), list) for key in SESSION_KEYS):
+        return first_string(node, ('name',))
+    return None
+
+def parse_when(value):
+    # "06:30 PM" -> (None, 1110); "2025-11-24T18:30:00+05:30" -> ("2025-11-24", 1110).
+    # Timestamps with an offset ("...T13:00:00Z") are converted to IST first.
+    if not isinstance(value, str):
+        return None, None
+    match = TIME_PATTERN.search(value)
+    if match:
+        return None, to_minutes(*match.groups())
+    try:
+        when = datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None, None
+    if when.tzinfo is not None:
+        when = when.astimezone(LOCAL_TZ)
+    if 'T' not in value and ' ' not in value:
+        return when.date().isoformat(), None
+    return when.date().isoformat(), when.hour * 60 + when.minute
+
+def parse_date(value):
+    date, _ = parse_when(value)
+    if date:
+        return date
+    if isinstance(value, str) and re.fullmatch(r'\d{8}', value):
+        return f"{value[:4]}-{value[4:6]}-{value[6:]}"
+    return None
+
+def walk(node, context, shows):
+    # Depth-first over the JSON. Venue, date, format and language are
+    # inherited from enclosing objects, so both {cinema: {sessions: [...]}}
+    # and {date: ..., cinemas: [{name, sessions}]} layouts resolve.
+    if isinstance(node, list):
+        for item in node:
+            walk(item, context, shows)
+        return
+    if not isinstance(node, dict):
+        return
+
+    context = dict(context)
+    venue = venue_name(node)
+    if venue:
+        context['theatre'] = venue
+    for key in DATE_KEYS:
+        date = parse_date(node.get(key))
+        if date:
+            context['date'] = date
+            break
+    fmt = first_string(node, FORMAT_KEYS)
+    if fmt:
+        context['format'] = fmt
+    language = first_string(node, LANGUAGE_KEYS)
+    if language:
+        context['language'] = language
+
+    for key in TIME_KEYS:
+        date, minutes = parse_when(node.get(key))
+        if minutes is not None:
+            if context.get('theatre') and (date or context.get('date')):
+                shows.append({
+                    "theatre": context['theatre'],
+                    "date": date or context['date'],
+                    "time": format_time(minutes),
+                    "format": context.get('format'),
+                    "language": context.get('language')
+                })
+            break
+
+    for value in node.values():
+        if isinstance(value, (dict, list)):
+            walk(value, context, shows)
+
+def extract_showtimes(data):
+    # Every (theatre, date, time, format) session in a decoded
+    # __NEXT_DATA__ payload, each with the closest format / language found
+    # around it
+    shows = []
+    walk(data.get('props', {}).get('pageProps', data), {}, shows)
+
+    unique = {}
+    for show in shows:
+        unique.setdefault((show['theatre'], show['date'], show['time'], show['format']), show)
+    return list(unique.values())
+
+def most_common(values):
+    counts = {}
+    for value in values:
+        if value:
+            counts[value] = counts.get(value, 0) + 1
+    return max(counts, key=counts.get) if counts else None
@@ -0,0 +1,284 @@
+import argparse
+import os
+import queue
+import random
+import threading
+import time
+from concurrent.futures import Future
+
+from metrics import metrics
+from ratelimit import TokenBucket
+
+# Twilio throughput is per sender; 1 msg/s is the conservative default for
+# a WhatsApp number, raise it for senders with a higher limit.
+MESSAGES_PER_SECOND = float(os.environ.get('TWILIO_MESSAGES_PER_SECOND', 1))
+SEND_CONCURRENCY = int(os.environ.get('TWILIO_SEND_CONCURRENCY', 4))
+
+MAX_RETRIES = 4
+RETRY_BASE_DELAY = 1.0
+
+# Twilio rejects WhatsApp bodies longer than this
+MAX_MESSAGE_LENGTH = 1600
+
+
+def is_retryable(exc):
+    # TwilioRestException and StubTransportError both carry the HTTP status
+    status = getattr(exc, 'status', None)
+    return status == 429 or (status is not None and status >= 500)
+
+
+class TwilioTransport:
+    def __init__(self, account_sid, auth_token):
+        from twilio.rest import Client
+
+        # One client for the whole process, its HTTP session keeps the
+        # connection to api.twilio.com alive between messages
+        self.client = Client(account_sid, auth_token)
+
+    def send(self, from_, to, body):
+        return self.client.messages.create(body=body, from_=from_, to=to).sid
+
+
+class StubTransportError(Exception):
+    def __init__(self, status):
+        super().__init__(f"stub transport error {status}")
+        self.status = status
+
+
+class StubTransport:
+    # Offline stand-in for Twilio with configurable latency and failures,
+    # used to measure dispatcher throughput without sending anything.
+
+    def __init__(self, latency=0.0, error_rate=0.0, error_status=503):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.sent = []
+        self.lock = threading.Lock()
+
+    def send(self, from_, to, body):
+        if self.latency:
+            time.sleep(self.latency)
+        if self.error_rate and random.random() < self.error_rate:
+            raise StubTransportError(self.error_status)
+        with self.lock:
+            self.sent.append((to, body))
+            return f"SM-stub-{len(self.sent)}"
+
+
+class NotificationDispatcher:
+    # Background send queue. Checkers submit() and carry on; worker threads
+    # pace the sends with a token bucket, retry 429/5xx with exponential
+    # backoff, and resolve the returned Future with True/False.
+
+    def __init__(self, transport, from_number, default_to=None, rate=MESSAGES_PER_SECOND,
+                 concurrency=SEND_CONCURRENCY, max_retries=MAX_RETRIES, retry_delay=RETRY_BASE_DELAY):
+        self.transport = transport
+        self.from_number = from_number
+        self.default_to = default_to
+        self.bucket = TokenBucket(rate, capacity=1)
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+
+        self.workers = [
+            threading.Thread(target=self._work, name=f"notify-{i}", daemon=True)
+            for i in range(max(1, concurrency))
+        ]
+        for worker in self.workers:
+            worker.start()
+
+    def submit(self, to, body):
+        future = Future()
+        self.queue.put((to or self.default_to, body, future))
+        return future
+
+    def _work(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            to, body, future = item
+            try:
+                future.set_result(self._deliver(to, body))
+            except Exception as e:
+                future.set_exception(e)
+
+    def _deliver(self, to, body):
+        if self.transport is None:
+            print("Twilio credentials missing. Skipping notification.")
+            print(f"Message: {body}")
+            return False
+
+        for attempt in range(self.max_retries + 1):
+            self.bucket.acquire()
+            try:
+                sid = self.transport.send(self.from_number, to, body)
+            except Exception as e:
+                if attempt < self.max_retries and is_retryable(e):
+                    with self.lock:
+                        self.retried += 1
+                    metrics.inc('notification_retries_total')
+                    time.sleep(self.retry_delay * (2 ** attempt) * random.uniform(0.5, 1.5))
+                    continue
+                print(f"Failed to send notification to {to}: {e}")
+                with self.lock:
+                    self.failed += 1
+                metrics.inc('notifications_total', result='failed')
+                return False
+
+            print(f"Notification sent successfully to {to}! SID: {sid}")
+            with self.lock:
+                self.sent += 1
+            metrics.inc('notifications_total', result='sent')
+            return True
+
+    def close(self):
+        # Lets queued messages drain, then stops the workers
+        for _ in self.workers:
+            self.queue.put(None)
+        for worker in self.workers:
+            worker.join()
+
+    def summary(self):
+        return f"Notifications: {self.sent} sent, {self.failed} failed, {self.retried} retries"
+
+
+def split_lines(section, budget):
+    # Cuts an oversized section at line breaks so booking links stay whole;
+    # only a single line longer than `budget` is cut mid-line
+    pieces = []
+    current = ""
+    for line in section.split("\n"):
+        while len(line) > budget:
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(line[:budget])
+            line = line[budget:]
+        candidate = f"{current}\n{line}" if current else line
+        if len(candidate) > budget:
+            pieces.append(current)
+            current = line
+        else:
+            current = candidate
+    pieces.append(current)
+    return pieces
+
+def render_digest(sections, limit=MAX_MESSAGE_LENGTH):
+    # Packs sections into as few messages as fit the length limit. A lone
+    # section goes out as-is; split digests get a "(1/3)" style prefix.
+    if len(sections) == 1 and len(sections[0]) <= limit:
+        return list(sections)
+
+    budget = limit - 12  # room for the part prefix
+    pieces = []
+    for section in sections:
+        if len(section) > budget:
+            pieces.extend(split_lines(section, budget))
+        else:
+            pieces.append(section)
+
+    chunks = []
+    header = f"🎟️ {len(sections)} alerts matched:" if len(sections) > 1 else ""
+    current = header
+    for piece in pieces:
+        candidate = f"{current}\n\n{piece}" if current else piece
+        if len(candidate) <= budget:
+            current = candidate
+        elif current == header:
+            # The header only goes out in front of the first section
+            current = piece
+        else:
+            chunks.append(current)
+            current = piece
+    chunks.append(current)
+
+    if len(chunks) > 1:
+        chunks = [f"({i}/{len(chunks)}) {chunk}" for i, chunk in enumerate(chunks, 1)]
+    return chunks
+
+
+class DigestBatch:
+    # Collects one cycle's matches per recipient so each phone gets a
+    # single digest (split only when it exceeds the length limit) instead
+    # of one message per alert.
+
+    def __init__(self):
+        self.recipients = {}
+
+    def add(self, to, section, tag=None):
+        sections, tags = self.recipients.setdefault(to, ([], []))
+        # Identical alerts for the same phone collapse into one section
+        if section not in sections:
+            sections.append(section)
+        if tag is not None:
+            tags.append(tag)
+
+    def __len__(self):
+        return sum(len(sections) for sections, _ in self.recipients.values())
+
+    def send(self, dispatcher):
+        # Returns [(tags, futures)], one entry per recipient
+        batches = []
+        for to, (sections, tags) in self.recipients.items():
+            futures = [dispatcher.submit(to, chunk) for chunk in render_digest(sections)]
+            batches.append((tags, futures))
+        self.recipients = {}
+        return batches
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+def create_dispatcher():
+    # NOTIFY_TRANSPORT=stub swaps Twilio for StubTransport (offline runs)
+    if os.environ.get('NOTIFY_TRANSPORT') == 'stub':
+        transport = StubTransport(latency=float(os.environ.get('NOTIFY_STUB_LATENCY', 0.2)))
+    elif os.environ.get('TWILIO_ACCOUNT_SID') and os.environ.get('TWILIO_AUTH_TOKEN'):
+        transport = TwilioTransport(os.environ['TWILIO_ACCOUNT_SID'], os.environ['TWILIO_AUTH_TOKEN'])
+    else:
+        transport = None
+
+    return NotificationDispatcher(
+        transport,
+        from_number=os.environ.get('TWILIO_FROM_WHATSAPP'),
+        default_to=os.environ.get('TWILIO_TO_WHATSAPP')
+    )
+
+def get_dispatcher():
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = create_dispatcher()
+        return _dispatcher
+
+
+if __name__ == "__main__":
+    # Offline throughput check: python notifier.py --messages 200 --rate 20
+    parser = argparse.ArgumentParser(description="Measure dispatcher throughput against the stub transport.")
+    parser.add_argument("--messages", type=int, default=100)
+    parser.add_argument("--rate", type=float, default=MESSAGES_PER_SECOND)
+    parser.add_argument("--concurrency", type=int, default=SEND_CONCURRENCY)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    stub = StubTransport(latency=args.latency, error_rate=args.error_rate)
+    dispatcher = NotificationDispatcher(stub, "whatsapp:+10000000000", rate=args.rate,
+                                        concurrency=args.concurrency, retry_delay=0.05)
+
+    started = time.monotonic()
+    futures = [dispatcher.submit(f"whatsapp:+9100000{i:05d}", f"Test message {i}") for i in range(args.messages)]
+    for future in futures:
+        future.result()
+    elapsed = time.monotonic() - started
+    dispatcher.close()
+
+    print(dispatcher.summary())
+    print(f"{args.messages} messages in {elapsed:.2f}s ({args.messages / elapsed:.1f} msg/s)")
@@ -0,0 +1,179 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import zlib
+
+from database import alert_key
+
+DATA_DIR = 'data'
+CACHE_FILE = os.path.join(DATA_DIR, 'http_cache.db')
+
+# Upper bound for stored bodies + parsed metadata, oldest entries go first
+MAX_CACHE_BYTES = 50 * 1024 * 1024
+
+
+def body_hash(body):
+    return hashlib.sha256(body).hexdigest()
+
+
+class PageCache:
+    # Persistent HTTP cache for the ticket checker. Keeps the validators
+    # (ETag / Last-Modified) and a body hash per URL so unchanged pages can
+    # be detected without parsing, plus the keys of the alerts that were
+    # already evaluated against the current version of the page (and, for
+    # delivered matches, what was sent).
+
+    def __init__(self, path=CACHE_FILE, max_bytes=MAX_CACHE_BYTES):
+        if not os.path.exists(os.path.dirname(path) or '.'):
+            os.makedirs(os.path.dirname(path))
+
+        self.max_bytes = max_bytes
+        self.conn = sqlite3.connect(path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS pages (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                body_hash TEXT,
+                body BLOB,
+                meta TEXT,
+                evaluated TEXT,
+                size INTEGER NOT NULL DEFAULT 0,
+                last_access REAL NOT NULL
+            )
+        ''')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_pages_last_access ON pages (last_access)')
+        self.conn.commit()
+
+        self.not_modified = 0
+        self.hash_hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+    def get(self, url):
+        row = self.conn.execute('SELECT * FROM pages WHERE url = ?', (url,)).fetchone()
+        if row:
+            self.conn.execute('UPDATE pages SET last_access = ? WHERE url = ?', (time.time(), url))
+        return row
+
+    def conditional_headers(self, url):
+        row = self.get(url)
+        headers = {}
+        if row and row['etag']:
+            headers['If-None-Match'] = row['etag']
+        if row and row['last_modified']:
+            headers['If-Modified-Since'] = row['last_modified']
+        return headers
+
+    def revalidate(self, url, response, digest=None):
+        # Returns the cached row if the response says the page is unchanged
+        # (304, or a 200 whose body hashes the same as last time), else None.
+        # Streamed responses pass the digest of the bytes they actually read.
+        row = self.get(url)
+        if row is None:
+            self.misses += 1
+            return None
+
+        if response.status_code == 304:
+            self.not_modified += 1
+            return row
+
+        if row['body_hash'] == (digest or body_hash(response.content)):
+            self.hash_hits += 1
+            # Keep the fresh validators so the next run can get a 304
+            self.conn.execute(
+                'UPDATE pages SET etag = ?, last_modified = ? WHERE url = ?',
+                (response.headers.get('ETag'), response.headers.get('Last-Modified'), url)
+            )
+            return row
+
+        self.misses += 1
+        return None
+
+    def store(self, url, response, meta=None, body=None, digest=None):
+        digest = digest or body_hash(response.content)
+        body = zlib.compress(body) if body is not None else None
+        meta = json.dumps(meta) if meta is not None else None
+        size = len(body or b'') + len(meta or '')
+
+        # Evaluated alerts only carry over while the content hash is the same
+        self.conn.execute('''
+            INSERT INTO pages
+                (url, etag, last_modified, body_hash, body, meta, evaluated, size, last_access)
+            VALUES (?, ?, ?, ?, ?, ?, NULL, ?, ?)
+            ON CONFLICT(url) DO UPDATE SET
+                etag = excluded.etag,
+                last_modified = excluded.last_modified,
+                evaluated = CASE WHEN body_hash = excluded.body_hash THEN evaluated END,
+                body_hash = excluded.body_hash,
+                body = excluded.body,
+                meta = excluded.meta,
+                size = excluded.size,
+                last_access = excluded.last_access
+        ''', (url, response.headers.get('ETag'), response.headers.get('Last-Modified'),
+              digest, body, meta, size, time.time()))
+
+    def body(self, row):
+        return zlib.decompress(row['body']).decode('utf-8', errors='replace') if row['body'] else None
+
+    def meta(self, row):
+        return json.loads(row['meta']) if row['meta'] else None
+
+    def evaluated(self, url):
+        # {alert key: None (no match) or [match hash, message] (delivered)}
+        # for the cached version of this page
+        row = self.conn.execute('SELECT evaluated FROM pages WHERE url = ?', (url,)).fetchone()
+        if row is None or not row['evaluated']:
+            return {}
+        evaluated = json.loads(row['evaluated'])
+        # Older entries are a plain list of keys that didn't match
+        return dict.fromkeys(evaluated) if isinstance(evaluated, list) else evaluated
+
+    def update_evaluated(self, url, entries):
+        row = self.conn.execute('SELECT 1 FROM pages WHERE url = ?', (url,)).fetchone()
+        if row is None:
+            return
+        evaluated = self.evaluated(url)
+        evaluated.update(entries)
+        self.conn.execute('UPDATE pages SET evaluated = ? WHERE url = ?', (json.dumps(evaluated, sort_keys=True), url))
+
+    def mark_evaluated(self, url, alerts):
+        # Alerts that didn't match this version of the page
+        self.update_evaluated(url, {alert_key(a): None for a in alerts})
+
+    def mark_delivered(self, url, key, match_digest, message):
+        # An alert whose match on this version of the page was sent; an
+        # unchanged page only needs its cooldown checked, not a re-parse
+        self.update_evaluated(url, {key: [match_digest, message]})
+
+    def evict(self):
+        total = self.conn.execute('SELECT COALESCE(SUM(size), 0) FROM pages').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        rows = self.conn.execute('SELECT url, size FROM pages ORDER BY last_access').fetchall()
+        for row in rows:
+            if total <= self.max_bytes:
+                break
+            self.conn.execute('DELETE FROM pages WHERE url = ?', (row['url'],))
+            total -= row['size']
+            self.evicted += 1
+
+    def summary(self):
+        hits = self.not_modified + self.hash_hits
+        lookups = hits + self.misses
+        ratio = (hits / lookups * 100) if lookups else 0
+        return (f"Page cache: {hits}/{lookups} hits ({ratio:.0f}%) - "
+                f"{self.not_modified} not modified, {self.hash_hits} same hash, "
+                f"{self.misses} misses, {self.evicted} evicted")
+
+    def flush(self):
+        self.evict()
+        self.conn.commit()
+
+    def close(self):
+        self.flush()
+        self.conn.close()
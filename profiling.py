@@ -0,0 +1,208 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+DATA_DIR = 'data'
+
+# Seconds between stack samples
+SAMPLE_INTERVAL = 0.005
+TOP_N = 25
+
+# Leaf frames of threads that are parked rather than working: idle pool
+# workers, threads blocked on a lock or queue, an event loop with nothing
+# to do. Samples ending in one of them are dropped unless include_idle.
+IDLE_FRAMES = {
+    ('thread.py', '_worker'),
+    ('threading.py', 'wait'),
+    ('threading.py', '_wait_for_tstate_lock'),
+    ('queue.py', 'get'),
+    ('selectors.py', 'select'),
+    ('_base.py', 'result'),
+}
+
+# Thread id -> URL it is fetching or parsing right now, filled in by
+# working_on() while a profiler with url tracking runs
+_urls = {}
+_tracking = False
+
+@contextmanager
+def working_on(url):
+    # Attributes samples taken inside the block to `url`. Costs one global
+    # lookup when no profiler is running.
+    if not _tracking:
+        yield
+        return
+    ident = threading.get_ident()
+    previous = _urls.get(ident)
+    _urls[ident] = url
+    try:
+        yield
+    finally:
+        if previous is None:
+            _urls.pop(ident, None)
+        else:
+            _urls[ident] = previous
+
+def frame_label(code):
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+def collapsed_safe(text):
+    # ';' separates frames and the last ' ' separates the count
+    return text.replace(';', '%3B').replace(' ', '%20')
+
+
+class SamplingProfiler:
+    # Samples the stack of every thread each `interval` seconds from a
+    # background thread, so cloudscraper, BeautifulSoup and sqlite time
+    # all show up, I/O waits included. Stacks are kept root-first as
+    # tuples of (file:function) labels.
+
+    def __init__(self, interval=SAMPLE_INTERVAL, track_urls=False, include_idle=False):
+        self.interval = interval
+        self.track_urls = track_urls
+        self.include_idle = include_idle
+        self.stacks = Counter()       # stack -> samples
+        self.url_stacks = Counter()   # (url, stack) -> samples
+        self.samples = 0
+        self.ticks = 0
+        self.elapsed = 0.0
+        self.stopping = threading.Event()
+        self.thread = None
+        self.started = None
+
+    def start(self):
+        global _tracking
+        _tracking = self.track_urls
+        self.started = time.perf_counter()
+        self.thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        global _tracking
+        self.stopping.set()
+        self.thread.join()
+        self.elapsed = time.perf_counter() - self.started
+        _tracking = False
+        _urls.clear()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self.stopping.wait(self.interval):
+            self.ticks += 1
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(frame_label(frame.f_code))
+                    frame = frame.f_back
+                if not stack:
+                    continue
+                leaf = tuple(stack[0].split(':', 1))
+                if not self.include_idle and leaf in IDLE_FRAMES:
+                    continue
+                stack = tuple(reversed(stack))
+                self.samples += 1
+                self.stacks[stack] += 1
+                url = _urls.get(ident)
+                if url is not None:
+                    self.url_stacks[(url, stack)] += 1
+
+    @property
+    def seconds_per_sample(self):
+        # Wall time one sample stands for, from the ticks actually taken
+        return self.elapsed / self.ticks if self.ticks else self.interval
+
+    def collapsed(self):
+        # Brendan Gregg's folded format, one "frame;frame;frame count" per
+        # line, ready for flamegraph.pl or speedscope. With url tracking
+        # the URL being worked on becomes the root frame.
+        lines = []
+        if self.track_urls:
+            url_samples = Counter()
+            for (url, stack), count in self.url_stacks.items():
+                lines.append(f"{collapsed_safe(url)};{';'.join(stack)} {count}")
+                url_samples[stack] += count
+            for stack, count in self.stacks.items():
+                rest = count - url_samples[stack]
+                if rest:
+                    lines.append(f"{';'.join(stack)} {rest}")
+        else:
+            lines = [f"{';'.join(stack)} {count}" for stack, count in self.stacks.items()]
+        return "\n".join(sorted(lines)) + "\n"
+
+    def hotspots(self, top=TOP_N):
+        # (label, self samples, total samples) for the top frames by self
+        # time; total counts each frame once per sample (recursion safe)
+        own = Counter()
+        total = Counter()
+        for stack, count in self.stacks.items():
+            own[stack[-1]] += count
+            for label in set(stack):
+                total[label] += count
+        return [(label, count, total[label]) for label, count in own.most_common(top)]
+
+    def by_url(self, top=TOP_N):
+        # (url, samples, hottest leaf frame) for the most expensive URLs
+        samples = Counter()
+        leaves = {}
+        for (url, stack), count in self.url_stacks.items():
+            samples[url] += count
+            leaves.setdefault(url, Counter())[stack[-1]] += count
+        return [(url, count, leaves[url].most_common(1)[0][0]) for url, count in samples.most_common(top)]
+
+    def report(self, top=TOP_N):
+        per_sample = self.seconds_per_sample
+        total = self.samples or 1
+        lines = [
+            f"Profile: {self.samples} samples over {self.elapsed:.1f}s ({self.ticks} ticks, {per_sample * 1000:.1f}ms each)",
+            "Times are thread-seconds: concurrent threads each add their own.",
+            "",
+            f"{'self':>8} {'self%':>6} {'total':>8} {'total%':>6}  frame",
+        ]
+        for label, own, cumulative in self.hotspots(top):
+            lines.append(f"{own * per_sample:>7.2f}s {own * 100 / total:>5.1f}% "
+                         f"{cumulative * per_sample:>7.2f}s {cumulative * 100 / total:>5.1f}%  {label}")
+
+        if self.track_urls:
+            lines += ["", f"{'time':>8} {'share':>6}  url (hottest frame)"]
+            for url, count, leaf in self.by_url(top):
+                lines.append(f"{count * per_sample:>7.2f}s {count * 100 / total:>5.1f}%  {url} ({leaf})")
+        return "\n".join(lines)
+
+    def write(self, job, directory=DATA_DIR, top=TOP_N):
+        # data/profile_<job>.folded and data/profile_<job>.txt
+        os.makedirs(directory, exist_ok=True)
+        base = os.path.join(directory, f"profile_{job}")
+        report = self.report(top)
+        with open(base + '.folded', 'w') as f:
+            f.write(self.collapsed())
+        with open(base + '.txt', 'w') as f:
+            f.write(report + "\n")
+        print(report)
+        print(f"Profile written to {base}.folded / .txt")
+
+
+def add_arguments(parser):
+    parser.add_argument("--profile", action="store_true",
+                        help="sample the run and write data/profile_<job>.folded (flamegraph input) and a hotspot table")
+    parser.add_argument("--profile-urls", action="store_true", help="also break profile samples down per URL")
+    parser.add_argument("--profile-interval", type=float, default=SAMPLE_INTERVAL, help="seconds between samples")
+    parser.add_argument("--profile-top", type=int, default=TOP_N, help="rows in the hotspot tables")
+
+@contextmanager
+def profiled(job, args):
+    # Runs the block under a SamplingProfiler when --profile was given
+    if not (args.profile or args.profile_urls):
+        yield None
+        return
+    profiler = SamplingProfiler(args.profile_interval, track_urls=args.profile_urls).start()
+    try:
+        yield profiler
+    finally:
+        profiler.stop()
+        profiler.write(job, top=args.profile_top)
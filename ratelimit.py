@@ -0,0 +1,60 @@
+import threading
+import time
+from urllib.parse import urlsplit
+
+
+class TokenBucket:
+    # Classic token bucket: `rate` tokens per second, bursts up to
+    # `capacity`. reserve() never blocks, it books a token and returns how
+    # long the caller has to wait for it, so the same bucket works from
+    # threads (time.sleep) and from asyncio (asyncio.sleep).
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(rate, 1))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    @classmethod
+    def per_minute(cls, count, capacity=None):
+        return cls(count / 60.0, capacity)
+
+    def reserve(self, tokens=1):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= tokens
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def acquire(self, tokens=1):
+        delay = self.reserve(tokens)
+        if delay:
+            time.sleep(delay)
+
+
+class HostBuckets:
+    # One TokenBucket per host, created on first use. Lets concurrent
+    # scrapers share a politeness budget per site instead of each worker
+    # sleeping on its own.
+
+    def __init__(self, rates, default_rate=1.0, capacity=1):
+        self.rates = dict(rates)
+        self.default_rate = default_rate
+        self.capacity = capacity
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def bucket(self, url):
+        host = urlsplit(url).hostname or ''
+        with self.lock:
+            bucket = self.buckets.get(host)
+            if bucket is None:
+                bucket = self.buckets[host] = TokenBucket(self.rates.get(host, self.default_rate), self.capacity)
+            return bucket
+
+    def acquire(self, url):
+        self.bucket(url).acquire()
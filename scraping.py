@@ -0,0 +1,113 @@
+import threading
+from concurrent.futures import Future
+
+import cloudscraper
+from bs4 import BeautifulSoup
+
+from metrics import metrics, timed_get
+from profiling import working_on
+from ratelimit import HostBuckets
+
+# Requests per second per host, shared by every scraping thread
+HOST_RATES = {
+    "in.bookmyshow.com": 1.0,
+    "www.district.in": 1.0,
+}
+
+host_buckets = HostBuckets(HOST_RATES)
+
+# Cloudscraper sessions aren't thread-safe, each thread gets its own
+_local = threading.local()
+
+def get_scraper():
+    scraper = getattr(_local, 'scraper', None)
+    if scraper is None:
+        scraper = _local.scraper = cloudscraper.create_scraper()
+    return scraper
+
+def fetch(url, **kwargs):
+    # Paced by the host's bucket instead of fixed sleeps
+    host_buckets.acquire(url)
+    return timed_get(get_scraper().get, url, **kwargs)
+
+
+class ResponseMemo:
+    # Per-run memo of GET responses and everything derived from them (the
+    # parsed soup, its text, ...), so each URL is downloaded and parsed at
+    # most once no matter how many scraper steps look at it. Concurrent
+    # requests for the same URL wait for the first one. Entries can be
+    # tagged with a scope (the city being scraped) and evicted together
+    # once that city is done.
+
+    def __init__(self, fetch=fetch):
+        self.fetch = fetch
+        self.entries = {}
+        self.scopes = {}    # scope -> keys first requested under it
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+    def derived(self, url, name, build, scope=None):
+        # build() runs once per (url, name); failures aren't remembered
+        key = (url, name)
+        with self.lock:
+            future = self.entries.get(key)
+            owner = future is None
+            if owner:
+                future = self.entries[key] = Future()
+                self.scopes.setdefault(scope, set()).add(key)
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        if owner:
+            try:
+                with working_on(url):
+                    future.set_result(build())
+            except BaseException as e:
+                with self.lock:
+                    self.entries.pop(key, None)
+                future.set_exception(e)
+        return future.result()
+
+    def get(self, url, scope=None):
+        return self.derived(url, 'response', lambda: self.fetch(url), scope)
+
+    def soup(self, url, scope=None):
+        def parse():
+            html = self.get(url, scope).text
+            with metrics.timer('parse_seconds', stage='soup'):
+                return BeautifulSoup(html, 'html.parser')
+        return self.derived(url, 'soup', parse, scope)
+
+    def text(self, url, scope=None):
+        def extract():
+            soup = self.soup(url, scope)
+            with metrics.timer('parse_seconds', stage='text'):
+                return soup.get_text()
+        return self.derived(url, 'text', extract, scope)
+
+    def scoped(self, scope):
+        # get() bound to `scope`, for fetchers that only take a URL
+        return lambda url: self.get(url, scope)
+
+    def evict(self, scope):
+        # Drops every entry requested under `scope` so its bodies, soups
+        # and texts can be freed
+        with self.lock:
+            for key in self.scopes.pop(scope, ()):
+                if self.entries.pop(key, None) is not None:
+                    self.evicted += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries = {}
+            self.scopes = {}
+
+    def summary(self):
+        return f"Response memo: {self.misses} fetched/parsed, {self.hits} reused, {self.evicted} evicted"
+
+
+# Shared by every scraper module for the lifetime of a run
+memo = ResponseMemo()
@@ -0,0 +1,93 @@
+import re
+from array import array
+
+# Time-of-day buckets used by TIME:<BUCKET> alert filters
+MORNING = 1
+AFTERNOON = 2
+EVENING = 4
+NIGHT = 8
+
+TIME_BUCKETS = {
+    "MORNING": MORNING,
+    "AFTERNOON": AFTERNOON,
+    "EVENING": EVENING,
+    "NIGHT": NIGHT,
+}
+
+TIME_PATTERN = re.compile(r'(\d{1,2}):(\d{2})\s?(AM|PM)', re.IGNORECASE)
+
+
+def hour_bucket(hour):
+    if 5 <= hour < 12:
+        return MORNING
+    if 12 <= hour < 16:
+        return AFTERNOON
+    if 16 <= hour < 20:
+        return EVENING
+    return NIGHT
+
+# Bucket per hour, looked up instead of re-deriving it for every show.
+# Out of range hours (e.g. a scraped "13:00 PM") fall into NIGHT like before.
+HOUR_BUCKETS = bytes(hour_bucket(h) for h in range(36))
+
+
+def to_minutes(hour, minute, period):
+    hour = int(hour)
+    period = period.upper()
+    if period == 'PM' and hour != 12: hour += 12
+    if period == 'AM' and hour == 12: hour = 0
+    return hour * 60 + int(minute)
+
+
+def parse_time(text):
+    # "10:00 AM" -> 600, None if the string isn't a 12h time
+    match = TIME_PATTERN.search(text or '')
+    return to_minutes(*match.groups()) if match else None
+
+
+def format_time(minutes):
+    # 1110 -> "06:30 PM", the form show_time is stored in
+    hour, minute = divmod(minutes, 60)
+    return f"{hour % 12 or 12:02d}:{minute:02d} {'AM' if hour < 12 else 'PM'}"
+
+
+def compile_time_filters(buckets):
+    # ["MORNING", "NIGHT"] -> MORNING | NIGHT, unknown names are ignored
+    mask = 0
+    for bucket in buckets:
+        mask |= TIME_BUCKETS.get(bucket.upper(), 0)
+    return mask
+
+
+class ShowtimeIndex:
+    # Sorted, de-duplicated show start times (minutes after midnight) with
+    # the time-of-day bucket of each show precomputed. `mask` is the OR of
+    # all of them, so "does any show match" is a single AND.
+
+    __slots__ = ('minutes', 'masks', 'mask')
+
+    def __init__(self, minutes):
+        self.minutes = array('H', sorted(set(minutes)))
+        self.masks = bytes(HOUR_BUCKETS[min(m // 60, len(HOUR_BUCKETS) - 1)] for m in self.minutes)
+        self.mask = 0
+        for m in set(self.masks):
+            self.mask |= m
+
+    @classmethod
+    def from_html(cls, html):
+        return cls(to_minutes(*groups) for groups in TIME_PATTERN.findall(html))
+
+    @classmethod
+    def from_times(cls, times):
+        # Rows from the showtimes table, e.g. ["10:00 AM", "07:30 PM"]
+        minutes = (parse_time(t) for t in times)
+        return cls(m for m in minutes if m is not None)
+
+    def __len__(self):
+        return len(self.minutes)
+
+    def matches(self, mask):
+        return bool(self.mask & mask)
+
+    def shows_matching(self, mask):
+        return [m for m, bucket in zip(self.minutes, self.masks) if bucket & mask]
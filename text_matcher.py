@@ -0,0 +1,72 @@
+from collections import deque
+
+# Below this many patterns str.__contains__ (C, one pass per pattern) beats
+# walking the automaton in Python over the whole page
+AUTOMATON_MIN_PATTERNS = 200
+
+class PatternMatcher:
+    # Aho-Corasick automaton over a fixed set of lower-cased patterns.
+    # Built once per cycle from every alert's text filters, then each page
+    # is scanned once and returns all patterns that occur in it. Small sets
+    # are checked with plain substring tests instead.
+
+    def __init__(self, patterns):
+        self.patterns = frozenset(p.lower() for p in patterns if p)
+        self.use_automaton = len(self.patterns) >= AUTOMATON_MIN_PATTERNS
+
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [()]
+
+        for pattern in self.patterns if self.use_automaton else ():
+            node = 0
+            for char in pattern:
+                nxt = self.goto[node].get(char)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[node][char] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append(())
+                node = nxt
+            self.output[node] += (pattern,)
+
+        # Breadth-first so every fail target is finished before it's used
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, nxt in self.goto[node].items():
+                queue.append(nxt)
+                fallback = self.fail[node]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                target = self.goto[fallback].get(char, 0)
+                self.fail[nxt] = target if target != nxt else 0
+                self.output[nxt] += self.output[self.fail[nxt]]
+
+    def __len__(self):
+        return len(self.patterns)
+
+    def scan(self, text):
+        # `text` is expected to be lower-cased already (get_text().lower())
+        found = set()
+        if not self.patterns:
+            return found
+        if not self.use_automaton:
+            return {pattern for pattern in self.patterns if pattern in text}
+
+        goto, fail, output = self.goto, self.fail, self.output
+        remaining = len(self.patterns)
+        node = 0
+        for char in text:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if output[node]:
+                for pattern in output[node]:
+                    if pattern not in found:
+                        found.add(pattern)
+                        remaining -= 1
+                if not remaining:
+                    break
+        return found
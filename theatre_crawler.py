@@ -0,0 +1,178 @@
+import datetime
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from bs4 import BeautifulSoup
+
+from database import get_db_connection
+from metrics import metrics
+from profiling import working_on
+from showtimes import TIME_PATTERN, format_time, to_minutes
+
+# Dates probed per movie, today included
+CRAWL_DAYS = 3
+CRAWL_WORKERS = 6
+# Stop once this many probes in a row turned up no theatre we hadn't seen
+SATURATION_PROBES = 8
+
+
+def theatre_slug(name):
+    # Same normalization the theatres table has always used for `slug`
+    return re.sub(r'[^a-zA-Z0-9]', '', name.lower())
+
+def booking_url(movie_url, city_code, city_slug, date):
+    # Movie URL: .../movies/chennai/mastiii-4/ET00464040
+    # Booking URL: .../buytickets/mastiii-4-chennai/movie-chen-ET00464040-MT/20251124
+    parts = movie_url.split('/')
+    event_code = parts[-1]
+    slug = parts[-2]
+    return f"https://in.bookmyshow.com/buytickets/{slug}-{city_slug}/movie-{city_code}-{event_code}-MT/{date:%Y%m%d}"
+
+def parse_booking_page(html):
+    # [(theatre name, url, [show times])] for every cinema on a buytickets page
+    soup = BeautifulSoup(html, 'html.parser')
+    venues = [a for a in soup.find_all('a', href=True) if '/cinemas/' in a['href']]
+    if not venues:
+        # Fallback: generic venue class, no URL but the name is enough
+        venues = soup.find_all('a', class_='__venue-name')
+
+    results = []
+    for a in venues:
+        name = a.get_text().strip()
+        if not name:
+            continue
+        href = a.get('href', '')
+        if href and not href.startswith('http'):
+            href = "https://in.bookmyshow.com" + href
+
+        # Show times are listed next to the venue, inside its row
+        row = a.find_parent('li') or a.parent
+        times = []
+        for hour, minute, period in TIME_PATTERN.findall(row.get_text(' ')):
+            # Stored as "07:30 PM" like every other showtime row
+            show_time = format_time(to_minutes(hour, minute, period))
+            if show_time not in times:
+                times.append(show_time)
+        results.append((name, href, times))
+    return results
+
+def probe(fetch, url):
+    resp = fetch(url)
+    if resp.status_code != 200:
+        return []
+    with metrics.timer('parse_seconds', stage='booking'), working_on(url):
+        return parse_booking_page(resp.text)
+
+def crawl_theatres(fetch, city_name, city_code, city_slug, movies, days=CRAWL_DAYS,
+                   workers=CRAWL_WORKERS, saturation=SATURATION_PROBES):
+    # Probes the buytickets page of every movie for each of the next `days`
+    # dates. Today's pages go first since they list the most cinemas; the
+    # crawl stops early once `saturation` probes in a row add nothing new.
+    # Returns (theatres, showtimes), theatres deduped by theatre_slug().
+    today = datetime.date.today()
+    probes = [
+        (movie, today + datetime.timedelta(days=offset))
+        for offset in range(days)
+        for movie in movies
+    ]
+
+    theatres = {}
+    showtimes = []
+    idle = 0
+    completed = 0
+
+    pool = ThreadPoolExecutor(max_workers=max(1, workers))
+    try:
+        futures = {
+            pool.submit(probe, fetch, url): (movie, date, url)
+            for movie, date in probes
+            for url in [booking_url(movie['url'], city_code, city_slug, date)]
+        }
+        for future in as_completed(futures):
+            movie, date, book_url = futures[future]
+            completed += 1
+            try:
+                venues = future.result()
+            except Exception as e:
+                print(f"    [BMS] Error processing {movie['title']}: {e}")
+                venues = []
+
+            found = 0
+            for name, url, times in venues:
+                slug = theatre_slug(name)
+                if not slug:
+                    continue
+                if slug not in theatres:
+                    theatres[slug] = {"name": name, "url": url, "city": city_name}
+                    found += 1
+                for show_time in times:
+                    showtimes.append({
+                        "movie": movie['url'].split('/')[-1],
+                        "theatre": slug,
+                        "date": date.isoformat(),
+                        "time": show_time,
+                        "link": book_url
+                    })
+
+            idle = 0 if found else idle + 1
+            if idle >= saturation:
+                print(f"    [BMS] No new theatres in {idle} probes, stopping early.")
+                break
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+    print(f"    [BMS] Found {len(theatres)} theatres, {len(showtimes)} showtimes in {completed}/{len(probes)} probes.")
+    return list(theatres.values()), showtimes
+
+def save_crawl(city_name, theatres, showtimes):
+    # Theatres are matched to existing rows by slug so a name spelled
+    # slightly differently doesn't create a duplicate; showtimes reference
+    # movies by slug (the BMS event code, as saved by save_movies_to_db).
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    started = time.perf_counter()
+    written = {'theatres': 0, 'showtimes': 0}
+
+    try:
+        cursor.execute('SELECT slug, id FROM theatres WHERE city = ?', (city_name,))
+        theatre_ids = {row[0]: row[1] for row in cursor.fetchall() if row[0]}
+        new_theatres = {}
+        for theatre in theatres:
+            slug = theatre_slug(theatre['name'])
+            if slug not in theatre_ids and slug not in new_theatres:
+                new_theatres[slug] = (theatre['name'], city_name, slug)
+        if new_theatres:
+            cursor.executemany('''
+                INSERT OR IGNORE INTO theatres (name, city, slug)
+                VALUES (?, ?, ?)
+            ''', list(new_theatres.values()))
+            written['theatres'] = cursor.rowcount
+            cursor.execute('SELECT slug, id FROM theatres WHERE city = ?', (city_name,))
+            theatre_ids = {row[0]: row[1] for row in cursor.fetchall() if row[0]}
+
+        cursor.execute('SELECT slug, id FROM movies WHERE city = ?', (city_name,))
+        movie_ids = {row[0]: row[1] for row in cursor.fetchall()}
+
+        rows = []
+        for show in showtimes:
+            movie_id = movie_ids.get(show['movie'])
+            theatre_id = theatre_ids.get(show['theatre'])
+            if movie_id is None or theatre_id is None:
+                continue
+            rows.append((movie_id, theatre_id, show['date'], show['time'], show['link']))
+        cursor.executemany('''
+            INSERT OR IGNORE INTO showtimes (movie_id, theatre_id, show_date, show_time, link)
+            VALUES (?, ?, ?, ?, ?)
+        ''', rows)
+        written['showtimes'] = cursor.rowcount
+
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    metrics.observe('db_write_seconds', time.perf_counter() - started, stage='crawl')
+    for table, count in written.items():
+        metrics.record_rows(table, count)